@@ -1,16 +1,29 @@
+import os
+import tempfile
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.filters import Command
 
 from database import (
-    get_stats, get_all_patients, get_patient_results,
-    get_unread_alerts, mark_alerts_read
+    get_stats, rebuild_stats, backfill_survey_answers,
+    get_patients_page, get_patient_results_page, get_deteriorating_patients,
+    get_alert_watermark, count_alerts_after, get_alerts_page, ack_alerts
 )
-from keyboards import admin_keyboard
+from keyboards import admin_keyboard, pager_keyboard
+from answer_codec import decode_answers
+from export import export_archive, FORMATS, parse_watermark, format_watermark
+from analytics import cohort_analytics
+from throttling import send_priority, BULK
 from config import ADMIN_IDS
 
 router = Router()
 
+PAGE_SIZE = 30
+RESULTS_PAGE_SIZE = 10
+ALERTS_PAGE_SIZE = 20
+SURVEY_TYPES = ("GAD7", "PHQ9")
+
 
 def is_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
@@ -54,13 +67,123 @@ async def admin_stats(callback: CallbackQuery):
     await callback.answer()
 
 
+def format_analytics(report: dict) -> str:
+    if not report:
+        return "📈 <b>Аналитика</b>\n\nРезультатов пока нет."
+
+    text = "📈 <b>Аналитика</b>\n"
+    for survey_type, data in report.items():
+        text += (
+            f"\n<b>{survey_type}</b>: {data['results']} результатов, "
+            f"{data['patients']} пациентов\n"
+            f"Средний балл: <b>{data['mean']:.1f}</b>, медиана: <b>{data['median']:g}</b>\n"
+        )
+        if data["followed"]:
+            share = data["worse"] / data["followed"] * 100
+            text += (
+                f"Ухудшение: <b>{share:.0f}%</b> "
+                f"({data['worse']} из {data['followed']} с 2+ опросами)\n"
+            )
+        text += "Языки: " + ", ".join(
+            f"{lang} {count} (ср. {mean:.1f})"
+            for lang, (count, mean) in data["languages"].items()
+        ) + "\n"
+        text += "Вопросы (ср.): " + " ".join(f"{m:g}" for m in data["items"]) + "\n"
+        text += f"По неделям ({' / '.join(data['levels'])}):\n"
+        for week, counts in data["weeks"]:
+            text += f"  {week}: {' / '.join(map(str, counts))}\n"
+    return text
+
+
+@router.callback_query(F.data == "admin_analytics")
+async def admin_analytics(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔", show_alert=True)
+        return
+
+    report = await cohort_analytics.get()
+
+    await callback.message.edit_text(
+        format_analytics(report),
+        reply_markup=admin_keyboard(),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.message(Command("rebuild_stats"))
+async def cmd_rebuild_stats(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Доступ запрещён.")
+        return
+
+    before, after = await rebuild_stats()
+    backfilled = await backfill_survey_answers()
+
+    text = "🔄 <b>Счётчики пересчитаны</b>\n\n"
+    for key, value in after.items():
+        mark = "✅" if before[key] == value else f"⚠️ было {before[key]}"
+        text += f"{key}: <b>{value}</b> {mark}\n"
+    text += f"\nОтветов по вопросам дозаписано: <b>{backfilled}</b>"
+
+    await message.answer(text, parse_mode="HTML")
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Доступ запрещён.")
+        return
+
+    parts = message.text.split()
+    fmt = parts[1].lower() if len(parts) > 1 else "csv"
+    try:
+        if fmt not in FORMATS:
+            raise ValueError
+        after = parse_watermark(parts[2]) if len(parts) > 2 else None
+    except ValueError:
+        await message.answer(
+            "Используйте: /export [csv|parquet] [patients=120,survey_results=3400,alerts=15]"
+        )
+        return
+
+    await message.answer("⏳ Готовлю выгрузку...")
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            path, counts, watermark = await export_archive(tmp, fmt, after)
+        except ImportError:
+            await message.answer("⚠️ Для parquet нужен pyarrow.")
+            return
+
+        caption = "📦 <b>Выгрузка</b>\n\n"
+        for table, count in counts.items():
+            caption += f"{table}: <b>{count}</b>\n"
+        caption += f"\nСледующая: <code>/export {fmt} {format_watermark(watermark)}</code>"
+
+        with send_priority(BULK):
+            await message.answer_document(
+                FSInputFile(path, filename=os.path.basename(path)),
+                caption=caption,
+                parse_mode="HTML"
+            )
+
+
 @router.callback_query(F.data == "admin_patients")
+@router.callback_query(F.data.startswith("admin_patients_"))
 async def admin_patients(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("⛔", show_alert=True)
         return
 
-    patients = await get_all_patients()
+    # admin_patients_next_<id> / admin_patients_prev_<id>
+    parts = callback.data.split("_")
+    if len(parts) == 4 and parts[2] == "prev":
+        patients, has_more = await get_patients_page(before_id=int(parts[3]), limit=PAGE_SIZE)
+        has_prev, has_next = has_more, True
+    else:
+        after_id = int(parts[3]) if len(parts) == 4 else 0
+        patients, has_more = await get_patients_page(after_id=after_id, limit=PAGE_SIZE)
+        has_prev, has_next = after_id > 0, has_more
 
     if not patients:
         await callback.message.edit_text(
@@ -79,8 +202,35 @@ async def admin_patients(callback: CallbackQuery):
             f"Дата: {p['registered_at'][:10]}\n"
         )
 
-    if len(text) > 4000:
-        text = text[:4000] + "\n\n... (список обрезан)"
+    await callback.message.edit_text(
+        text,
+        reply_markup=admin_keyboard(
+            prev_data=f"admin_patients_prev_{patients[0]['id']}" if has_prev else None,
+            next_data=f"admin_patients_next_{patients[-1]['id']}" if has_next else None,
+        ),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data == "admin_worse")
+async def admin_worse(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔", show_alert=True)
+        return
+
+    trends = await get_deteriorating_patients(limit=PAGE_SIZE)
+
+    if not trends:
+        text = "📉 Ухудшений с прошлого опроса нет."
+    else:
+        text = "📉 <b>Ухудшение с прошлого опроса:</b>\n\n"
+        for t in trends:
+            text += (
+                f"ID: <code>{t['patient_code']}</code> | {t['survey_type']} | "
+                f"{t['prev_score']} → {t['last_score']} (<b>+{t['delta']}</b>) | "
+                f"{t['last_completed_at'][:10]}\n"
+            )
 
     await callback.message.edit_text(
         text,
@@ -112,70 +262,123 @@ async def cmd_results(message: Message):
         return
 
     parts = message.text.split()
-    if len(parts) < 2:
-        await message.answer("Используйте: /results 0001")
+    if len(parts) < 2 or (len(parts) > 2 and parts[2].upper() not in SURVEY_TYPES):
+        await message.answer("Используйте: /results 0001 [GAD7|PHQ9]")
         return
 
     patient_code = parts[1]
-    results = await get_patient_results(patient_code)
+    survey_type = parts[2].upper() if len(parts) > 2 else None
+    page = await results_page(patient_code, survey_type)
 
-    if not results:
+    if page is None:
         await message.answer(
             f"📭 Результатов для пациента <code>{patient_code}</code> не найдено.",
             parse_mode="HTML"
         )
         return
 
-    text = f"📈 <b>Результаты пациента {patient_code}:</b>\n\n"
+    text, keyboard = page
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+
+@router.callback_query(F.data.startswith("admres_"))
+async def admin_results_page(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔", show_alert=True)
+        return
+
+    # admres_<код>_<GAD7|PHQ9|all>_<older|newer>_<id>
+    _, patient_code, survey_type, direction, result_id = callback.data.split("_")
+    cursor = {"before_id" if direction == "older" else "after_id": int(result_id)}
+    page = await results_page(
+        patient_code, None if survey_type == "all" else survey_type, **cursor
+    )
+
+    if page is not None:
+        text, keyboard = page
+        await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    await callback.answer()
+
+
+async def results_page(patient_code: str, survey_type: str | None, **cursor):
+    results, has_older, has_newer = await get_patient_results_page(
+        patient_code, RESULTS_PAGE_SIZE, survey_type=survey_type, **cursor
+    )
+    if not results:
+        return None
+
+    title = f"{patient_code}, {survey_type}" if survey_type else patient_code
+    text = f"📈 <b>Результаты пациента {title}:</b>\n\n"
 
     for r in results:
         text += (
             f"📋 <b>{r['survey_type']}</b> — {r['completed_at'][:16]}\n"
             f"   Баллы: {r['total_score']} | Уровень: {r['level']}\n"
-            f"   Ответы: {r['answers']}\n\n"
+            f"   Ответы: {decode_answers(r['answers'])}\n\n"
         )
 
-    if len(text) > 4000:
-        text = text[:4000] + "\n\n... (обрезано)"
-
-    await message.answer(text, parse_mode="HTML")
+    prefix = f"admres_{patient_code}_{survey_type or 'all'}"
+    keyboard = pager_keyboard(
+        f"{prefix}_newer_{results[0]['id']}" if has_newer else None,
+        f"{prefix}_older_{results[-1]['id']}" if has_older else None,
+    )
+    return text, keyboard if keyboard.inline_keyboard else None
 
 
 @router.callback_query(F.data == "admin_alerts")
+@router.callback_query(F.data.startswith("admin_alerts_"))
 async def admin_alerts(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         await callback.answer("⛔", show_alert=True)
         return
 
-    alerts = await get_unread_alerts()
+    admin_id = callback.from_user.id
+    watermark = await get_alert_watermark(admin_id)
+
+    # admin_alerts — с первого непросмотренного;
+    # admin_alerts_after_<id> / admin_alerts_before_<id> — листание
+    parts = callback.data.split("_")
+    if len(parts) == 4 and parts[2] == "before":
+        alerts, has_more = await get_alerts_page(
+            before_id=int(parts[3]), limit=ALERTS_PAGE_SIZE
+        )
+        has_prev, has_next = has_more, True
+    else:
+        after_id = int(parts[3]) if len(parts) == 4 else watermark
+        alerts, has_more = await get_alerts_page(after_id=after_id, limit=ALERTS_PAGE_SIZE)
+        has_prev, has_next = after_id > 0, has_more
 
     if not alerts:
         await callback.message.edit_text(
             "✅ Нет новых оповещений.",
-            reply_markup=admin_keyboard(),
+            reply_markup=admin_keyboard(
+                prev_data=f"admin_alerts_before_{watermark + 1}" if watermark else None
+            ),
             parse_mode="HTML"
         )
         await callback.answer()
         return
 
-    text = "🚨 <b>Оповещения:</b>\n\n"
+    unseen = await count_alerts_after(watermark)
+    text = f"🚨 <b>Оповещения</b> (новых: {unseen}):\n\n"
 
     for a in alerts:
+        mark = "🆕" if a["id"] > watermark else "⚠️"
         text += (
-            f"⚠️ Пациент <code>{a['patient_code']}</code>\n"
+            f"{mark} Пациент <code>{a['patient_code']}</code>\n"
             f"   Тип: {a['alert_type']}\n"
             f"   Ответ: {a['question_answer']}\n"
             f"   Дата: {a['created_at'][:16]}\n\n"
         )
 
-    if len(text) > 4000:
-        text = text[:4000] + "\n... (обрезано)"
-
-    await mark_alerts_read()
-
     await callback.message.edit_text(
         text,
-        reply_markup=admin_keyboard(),
+        reply_markup=admin_keyboard(
+            prev_data=f"admin_alerts_before_{alerts[0]['id']}" if has_prev else None,
+            next_data=f"admin_alerts_after_{alerts[-1]['id']}" if has_next else None,
+        ),
         parse_mode="HTML"
     )
+    # Прочитанными становятся только показанные оповещения
+    await ack_alerts(admin_id, alerts[0]["id"], alerts[-1]["id"])
     await callback.answer()
\ No newline at end of file
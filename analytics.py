@@ -0,0 +1,148 @@
+# Когортная аналитика по survey_results. Результаты каждого опросника и языки
+# пациентов загружаются одним запросом в массивы NumPy, все агрегаты считаются
+# без циклов по строкам. Отчёт кэшируется до появления новых результатов
+# (get_results_version).
+
+import asyncio
+
+import numpy as np
+
+from database import (
+    get_results_version, load_results_for_analytics, load_patient_languages
+)
+from answer_codec import decode_answers_batch
+import texts
+
+# Столбцы load_results_for_analytics
+TELEGRAM_ID, SCORE, COMPLETED_AT, ANSWERS, LEVEL = range(5)
+LEVELS = {
+    "GAD7": ("minimal", "mild", "moderate", "severe"),
+    "PHQ9": ("minimal", "mild", "moderate", "moderately_severe", "severe"),
+}
+ITEMS = {"GAD7": 7, "PHQ9": 9}
+WEEKS = 8
+
+
+def _matrix(rows: list, width: int):
+    # Кортежи целых из SQLite сразу в матрицу (строки × width), без транспонирования
+    return np.fromiter(
+        (value for row in rows for value in row), dtype=np.int64,
+        count=len(rows) * width
+    ).reshape(len(rows), width)
+
+
+def _patient_languages(telegram_id, patients):
+    # Номер языка для каждого результата; patients отсортированы по telegram_id
+    if not len(patients):
+        return np.full(telegram_id.shape, -1, dtype=np.int64)
+    pos = np.searchsorted(patients[:, 0], telegram_id).clip(max=len(patients) - 1)
+    found = patients[pos, 0] == telegram_id
+    return np.where(found, patients[pos, 1], -1)
+
+
+def _weekly_levels(completed_at, level, levels: tuple) -> list:
+    # [(понедельник недели, [число результатов по уровням])] за последние WEEKS недель
+    days = completed_at // 86400
+    # 1970-01-01 — четверг, поэтому (дни + 3) % 7 даёт номер дня от понедельника
+    weeks = days - (days + 3) % 7
+    week_values, week_idx = np.unique(weeks, return_inverse=True)
+
+    known = level >= 0
+    counts = np.bincount(
+        week_idx[known] * len(levels) + level[known],
+        minlength=len(week_values) * len(levels)
+    ).reshape(len(week_values), len(levels))
+
+    return [
+        (str(np.datetime64(int(week), "D")), row.tolist())
+        for week, row in zip(week_values[-WEEKS:], counts[-WEEKS:])
+    ]
+
+
+def _languages(language, score, languages: tuple) -> dict:
+    # Неизвестные языки (-1) попадают в последнюю корзину "?"
+    idx = np.where(language >= 0, language, len(languages))
+    counts = np.bincount(idx, minlength=len(languages) + 1)
+    sums = np.bincount(idx, weights=score, minlength=len(languages) + 1)
+    return {
+        lang: (int(count), float(total / count))
+        for lang, count, total in zip((*languages, "?"), counts, sums)
+        if count
+    }
+
+
+def _worsened(telegram_id, completed_at, score) -> tuple:
+    # Сравнение первого и последнего результата пациента: (прошли 2+ раза, стало хуже)
+    order = np.lexsort((completed_at, telegram_id))
+    ids = telegram_id[order]
+    scores = score[order]
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)] - 1
+    repeated = ends > starts
+    worse = scores[ends[repeated]] > scores[starts[repeated]]
+    return int(repeated.sum()), int(worse.sum())
+
+
+def _item_means(answers, n_items: int) -> list:
+    matrix = decode_answers_batch(answers, n_items)
+    answered = matrix >= 0
+    totals = np.where(answered, matrix, 0).sum(axis=0)
+    counts = answered.sum(axis=0)
+    return (totals / np.maximum(counts, 1)).round(2).tolist()
+
+
+def compute_survey(rows: list, patients, survey_type: str, languages: tuple) -> dict:
+    data = _matrix(rows, 5)
+    score = data[:, SCORE]
+    telegram_id = data[:, TELEGRAM_ID]
+    completed_at = data[:, COMPLETED_AT]
+    followed, worse = _worsened(telegram_id, completed_at, score)
+    return {
+        "results": len(rows),
+        "patients": int(np.unique(telegram_id).size),
+        "mean": float(score.mean()),
+        "median": float(np.median(score)),
+        "levels": LEVELS[survey_type],
+        "weeks": _weekly_levels(completed_at, data[:, LEVEL], LEVELS[survey_type]),
+        "languages": _languages(
+            _patient_languages(telegram_id, patients), score, languages
+        ),
+        "followed": followed,
+        "worse": worse,
+        "items": _item_means(data[:, ANSWERS], ITEMS[survey_type]),
+    }
+
+
+async def build_report() -> dict:
+    languages = tuple(texts.TEXTS)
+    rows = await load_patient_languages(languages)
+    patients = await asyncio.to_thread(_matrix, rows, 2)
+    report = {}
+    for survey_type, levels in LEVELS.items():
+        rows = await load_results_for_analytics(survey_type, levels)
+        if rows:
+            # Расчёт в потоке, чтобы не держать цикл событий
+            report[survey_type] = await asyncio.to_thread(
+                compute_survey, rows, patients, survey_type, languages
+            )
+    return report
+
+
+class CohortAnalytics:
+    def __init__(self):
+        self._version = None
+        self._report = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> dict:
+        version = await get_results_version()
+        if version == self._version:
+            return self._report
+        async with self._lock:
+            if version != self._version:
+                self._report = await build_report()
+                self._version = version
+        return self._report
+
+
+cohort_analytics = CohortAnalytics()
\ No newline at end of file
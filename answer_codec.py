@@ -0,0 +1,53 @@
+# Компактное хранение ответов опроса в одном INTEGER.
+#
+# Версия 1:
+#   биты 0..2n-1  — ответы по 2 бита (вопрос i в битах 2i, 2i+1), значения 0–3
+#   биты 24..27   — число ответов n (до 12)
+#   биты 28..31   — версия формата
+#
+# Отдельный вопрос читается прямо в SQL: (answers >> (2 * i)) & 3
+
+VERSION = 1
+BITS = 2
+MASK = (1 << BITS) - 1
+MAX_ITEMS = 12
+COUNT_SHIFT = 24
+VERSION_SHIFT = 28
+
+
+def encode_answers(answers) -> int:
+    if len(answers) > MAX_ITEMS:
+        raise ValueError(f"Too many answers: {len(answers)} > {MAX_ITEMS}")
+    packed = 0
+    for i, value in enumerate(answers):
+        if not 0 <= value <= MASK:
+            raise ValueError(f"Answer {i} out of range: {value}")
+        packed |= value << (BITS * i)
+    return packed | len(answers) << COUNT_SHIFT | VERSION << VERSION_SHIFT
+
+
+def decode_answers(packed: int) -> list:
+    version = packed >> VERSION_SHIFT
+    if version != VERSION:
+        raise ValueError(f"Unknown answers encoding version: {version}")
+    count = (packed >> COUNT_SHIFT) & 0xF
+    return [(packed >> (BITS * i)) & MASK for i in range(count)]
+
+
+def decode_answers_batch(values, n_items: int | None = None):
+    """Декодирует массив упакованных ответов в матрицу (строки × вопросы).
+
+    Позиции за пределами числа ответов строки заполняются -1.
+    """
+    import numpy as np
+
+    packed = np.asarray(values, dtype=np.int64)
+    if packed.size and np.any((packed >> VERSION_SHIFT) != VERSION):
+        raise ValueError("Unknown answers encoding version in batch")
+    counts = (packed >> COUNT_SHIFT) & 0xF
+    if n_items is None:
+        n_items = int(counts.max()) if packed.size else 0
+    shifts = BITS * np.arange(n_items, dtype=np.int64)
+    matrix = ((packed[:, None] >> shifts) & MASK).astype(np.int8)
+    matrix[np.arange(n_items) >= counts[:, None]] = -1
+    return matrix
@@ -0,0 +1,272 @@
+"""Бенчмарк обработчиков: реальный Dispatcher из bot.py, синтетические Update.
+
+Каждый синтетический пациент проходит /start, выбор языка, согласие, GAD-7,
+PHQ-9 и «Мои результаты»; админ периодически открывает статистику. Update
+подаются через dp.feed_update, Bot работает через заглушку сессии без сети,
+база — временный SQLite-файл. Для каждого обработчика выводятся число вызовов
+и p50/p95/p99 задержки, для всего прогона — пропускная способность. С
+--save-baseline результат сохраняется и следующие прогоны сравниваются с ним.
+
+Запуск: python bench_handlers.py [--patients 300] [--concurrency 50]
+        [--storage sqlite|memory] [--batch] [--api-latency 0]
+        [--baseline bench_baseline.json] [--save-baseline]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+# config требует токен и список админов — для бенчмарка подходят любые
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("ADMIN_IDS", "1")
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message, Update
+
+import database
+from bot import create_dispatcher
+from config import ADMIN_IDS
+from storage import SQLiteStorage, MemorySessionStorage
+
+ITEMS = {"gad7": 7, "phq9": 9}
+
+
+class StubSession(BaseSession):
+    """Сессия без сети: считает вызовы API и отвечает минимальным объектом."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method.__returning__ is Message:
+            chat_id = getattr(method, "chat_id", None) or 1
+            return Message(
+                message_id=1, date=datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                text=getattr(method, "text", None) or ""
+            )
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+class HandlerLabels(BaseMiddleware):
+    # Внутренний middleware: запоминает, какой обработчик получил update
+    def __init__(self):
+        self.labels = {}
+
+    async def __call__(self, handler, event, data):
+        self.labels[data["event_update"].update_id] = data["handler"].callback.__name__
+        return await handler(event, data)
+
+
+class Bench:
+    def __init__(self, dp, bot: Bot):
+        self.dp = dp
+        self.bot = bot
+        self.labels = HandlerLabels()
+        dp.message.middleware(self.labels)
+        dp.callback_query.middleware(self.labels)
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self._update_id = 0
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "Bench"}
+
+    def _message(self, user_id: int, text: str) -> dict:
+        return {
+            "message_id": 1, "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id), "text": text,
+        }
+
+    def command(self, user_id: int, text: str) -> Update:
+        self._update_id += 1
+        return Update(update_id=self._update_id, message=self._message(user_id, text))
+
+    def callback(self, user_id: int, data: str) -> Update:
+        self._update_id += 1
+        return Update(update_id=self._update_id, callback_query={
+            "id": str(self._update_id), "from": self._user(user_id),
+            "chat_instance": "bench", "data": data,
+            "message": self._message(user_id, "bench"),
+        })
+
+    async def feed(self, update: Update):
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+        elapsed = time.perf_counter() - started
+        label = self.labels.labels.pop(update.update_id, "unhandled")
+        self.latencies[label].append(elapsed)
+
+    async def patient(self, user_id: int, rng: random.Random):
+        await self.feed(self.command(user_id, "/start"))
+        await self.feed(self.callback(user_id, rng.choice(("lang_ru", "lang_kz"))))
+        await self.feed(self.callback(user_id, "consent_yes"))
+        for survey_type, items in ITEMS.items():
+            await self.feed(self.callback(user_id, f"start_{survey_type}"))
+            for idx in range(items):
+                value = rng.randint(0, 3)
+                await self.feed(self.callback(user_id, f"ans_{survey_type}_{idx}_{value}"))
+        await self.feed(self.callback(user_id, "my_results"))
+        await self.feed(self.callback(user_id, "main_menu"))
+
+    async def admin(self):
+        await self.feed(self.callback(ADMIN_IDS[0], "admin_stats"))
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def summarize(latencies: dict, elapsed: float) -> dict:
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "updates": total,
+        "seconds": elapsed,
+        "throughput": total / elapsed if elapsed else 0.0,
+        "handlers": {
+            name: {
+                "count": len(values),
+                "p50": percentile(values, 50) * 1000,
+                "p95": percentile(values, 95) * 1000,
+                "p99": percentile(values, 99) * 1000,
+            }
+            for name, values in sorted(latencies.items())
+        },
+    }
+
+
+def change(current: float, previous: float | None) -> str:
+    if not previous:
+        return ""
+    return f"{(current - previous) / previous * 100:+6.1f}%"
+
+
+def report(result: dict, baseline: dict | None):
+    handlers = (baseline or {}).get("handlers", {})
+    print(f"{'handler':<24}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, stats in result["handlers"].items():
+        line = (
+            f"{name:<24}{stats['count']:>7}{stats['p50']:>9.2f}"
+            f"{stats['p95']:>9.2f}{stats['p99']:>9.2f}"
+        )
+        previous = handlers.get(name)
+        if previous:
+            line += (
+                f"   vs baseline p50 {change(stats['p50'], previous['p50'])}"
+                f" p95 {change(stats['p95'], previous['p95'])}"
+                f" p99 {change(stats['p99'], previous['p99'])}"
+            )
+        print(line)
+    line = (
+        f"\n{result['updates']} updates in {result['seconds']:.2f}s: "
+        f"{result['throughput']:.0f} updates/s"
+    )
+    if baseline:
+        line += f" (baseline {baseline['throughput']:.0f}, {change(result['throughput'], baseline['throughput'])})"
+    print(line)
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.pool.path = os.path.join(tmp, "bench.db")
+        await database.pool.open()
+        await database.init_db()
+        if args.batch:
+            await database.write_batcher.start()
+
+        if args.storage == "sqlite":
+            storage = SQLiteStorage()
+        else:
+            storage = MemorySessionStorage()
+        dp = create_dispatcher(storage)
+        session = StubSession(args.api_latency / 1000)
+        bot = Bot("42:BENCH", session=session)
+        bench = Bench(dp, bot)
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def patient(n: int):
+            async with semaphore:
+                await bench.patient(100000 + n, random.Random(rng.random()))
+                if n % args.admin_every == 0:
+                    await bench.admin()
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(patient(n) for n in range(args.patients)))
+            elapsed = time.perf_counter() - started
+        finally:
+            await storage.close()
+            await database.write_batcher.stop()
+            await database.pool.close()
+
+    result = summarize(bench.latencies, elapsed)
+    result["api_calls"] = dict(session.calls)
+    result["errors"] = dict(bench.errors)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--batch", action="store_true", help="enable write batcher")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="ms per API call")
+    parser.add_argument("--admin-every", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = asyncio.run(run(args))
+    result["params"] = {
+        key: getattr(args, key)
+        for key in ("patients", "concurrency", "storage", "batch", "api_latency")
+    }
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != result["params"]:
+            print(f"Warning: baseline params differ: {baseline.get('params')}\n")
+
+    report(result, baseline)
+    print(f"API calls: {result['api_calls']}")
+    if result["errors"]:
+        print(f"Errors: {result['errors']}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
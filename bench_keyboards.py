@@ -0,0 +1,56 @@
+"""Микробенчмарк: сборка клавиатур на каждый вызов против готового реестра.
+
+Запуск: python bench_keyboards.py [--number 20000]
+"""
+import argparse
+import timeit
+
+import keyboards
+
+
+def per_answer_build():
+    # То, что раньше делалось на каждый ответ: новая клавиатура вопроса
+    keyboards._build_survey_answer_keyboard("kz", "phq9", 4)
+
+
+def per_answer_registry():
+    keyboards.survey_answer_keyboard("kz", "phq9", 4)
+
+
+def menu_build():
+    keyboards._build_main_menu_keyboard("ru")
+    keyboards._build_back_to_menu_keyboard("ru")
+    keyboards._build_admin_keyboard()
+
+
+def menu_registry():
+    keyboards.main_menu_keyboard("ru")
+    keyboards.back_to_menu_keyboard("ru")
+    keyboards.admin_keyboard()
+
+
+def measure(fn, number: int) -> float:
+    # Лучший из пяти прогонов, мкс на вызов
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"Registry: {len(keyboards.KEYBOARDS)} keyboards")
+    for name, build, registry in (
+        ("survey answer", per_answer_build, per_answer_registry),
+        ("menus", menu_build, menu_registry),
+    ):
+        built = measure(build, args.number)
+        cached = measure(registry, args.number)
+        print(
+            f"{name:>14}: build {built:8.2f} us  registry {cached:6.3f} us  "
+            f"saved {built - cached:8.2f} us/call ({built / cached:.0f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,27 @@ import logging
 from aiohttp import web
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import SimpleEventIsolation
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 
 from config import (
-    BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PATH,
-    WEBAPP_HOST, WEBAPP_PORT
+    BOT_TOKEN, WEBHOOK_URL, WEBHOOK_PATH, TELEGRAM_API_URL, METRICS_PATH,
+    WEBAPP_HOST, WEBAPP_PORT, DB_BATCH_WRITES,
+    SESSION_STORAGE, SESSION_TTL, SESSION_MAX
 )
-from database import init_db
+from database import init_db, pool, write_batcher, patient_cache, get_outbox_backlog
+from storage import SQLiteStorage, MemorySessionStorage
+from outbox import alert_outbox
+from throttling import send_scheduler
+from tracing import update_tracing
+from metrics import (
+    registry, metrics_handler, UpdateMetrics, HandlerMetrics, TelegramAPIMetrics
+)
+from texts import check_texts
 from handlers import start_router, surveys_router, admin_router
 
 logging.basicConfig(level=logging.INFO)
@@ -19,7 +31,11 @@ logger = logging.getLogger(__name__)
 
 
 async def on_startup(bot: Bot):
+    await pool.open()
     await init_db()
+    if DB_BATCH_WRITES:
+        await write_batcher.start()
+    alert_outbox.start(bot)
     await bot.set_webhook(WEBHOOK_URL)
     logger.info(f"Webhook set: {WEBHOOK_URL}")
 
@@ -27,20 +43,54 @@ async def on_startup(bot: Bot):
 async def on_shutdown(bot: Bot):
     await bot.delete_webhook()
     logger.info("Webhook deleted")
+    await alert_outbox.stop()
+    await write_batcher.stop()
+    await pool.close()
+    update_tracing.close()
 
 
-def main():
+def create_bot(session=None) -> Bot:
+    if session is None and TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
     bot = Bot(
         token=BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
-
-    dp = Dispatcher()
+    bot.session.middleware(send_scheduler)
+    bot.session.middleware(TelegramAPIMetrics())
+    return bot
+
+
+def create_storage():
+    # Сессии опросов: sqlite — переживают рестарт и общие для всех процессов
+    if SESSION_STORAGE == "sqlite":
+        return SQLiteStorage(ttl=SESSION_TTL)
+    return MemorySessionStorage(ttl=SESSION_TTL, max_sessions=SESSION_MAX)
+
+
+def create_dispatcher(storage=None) -> Dispatcher:
+    # Диспетчер с роутерами бота — общий для main(), bench_handlers.py
+    # и loadtest_webhook.py
+    if storage is None:
+        storage = create_storage()
+    dp = Dispatcher(storage=storage, events_isolation=SimpleEventIsolation())
+    # aiogram молча подменяет «ложное» хранилище своим MemoryStorage
+    if dp.storage is not storage:
+        raise RuntimeError(f"{type(storage).__name__} was replaced by aiogram")
+    # Трассировка — самый внешний middleware, чтобы охватить всю обработку
+    dp.update.outer_middleware(update_tracing)
+    dp.update.outer_middleware(UpdateMetrics())
+    dp.message.middleware(HandlerMetrics())
+    dp.callback_query.middleware(HandlerMetrics())
 
     dp.include_router(start_router)
     dp.include_router(surveys_router)
     dp.include_router(admin_router)
+    return dp
+
 
+def create_app(bot: Bot, dp: Dispatcher) -> web.Application:
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
@@ -53,6 +103,61 @@ def main():
     webhook_requests_handler.register(app, path=WEBHOOK_PATH)
     setup_application(app, dp, bot=bot)
 
+    if METRICS_PATH:
+        register_collectors(dp)
+        app.router.add_get(METRICS_PATH, metrics_handler)
+    return app
+
+
+def register_collectors(dp: Dispatcher):
+    # Считаются только при запросе /metrics
+    count_sessions = getattr(dp.storage, "count_sessions", None)
+    if count_sessions is not None:
+        registry.collector(
+            "qamqor_active_sessions", "Survey sessions in FSM storage", count_sessions
+        )
+    storage = dp.storage
+    if isinstance(storage, MemorySessionStorage):
+        registry.collector(
+            "qamqor_session_bytes", "Approximate memory used by survey sessions",
+            lambda: storage.stats()["bytes"]
+        )
+        registry.collector(
+            "qamqor_sessions_evicted_total", "Sessions evicted by the size limit",
+            lambda: storage.evicted, kind="counter"
+        )
+        registry.collector(
+            "qamqor_sessions_expired_total", "Sessions expired by TTL",
+            lambda: storage.expired, kind="counter"
+        )
+    registry.collector(
+        "qamqor_outbox_backlog", "Pending alert notifications", get_outbox_backlog
+    )
+    registry.collector(
+        "qamqor_send_queue_depth", "Bot API requests waiting in send scheduler",
+        lambda: send_scheduler.stats()["queue_depth"]
+    )
+    registry.collector(
+        "qamqor_send_retry_after_total", "429 responses seen by send scheduler",
+        lambda: send_scheduler.retry_after, kind="counter"
+    )
+    registry.collector(
+        "qamqor_patient_cache_hits_total", "Patient cache hits",
+        lambda: patient_cache.hits, kind="counter"
+    )
+    registry.collector(
+        "qamqor_patient_cache_misses_total", "Patient cache misses",
+        lambda: patient_cache.misses, kind="counter"
+    )
+
+
+def main():
+    check_texts()
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    app = create_app(bot, dp)
+
     web.run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT)
 
 
@@ -0,0 +1,130 @@
+import time
+from collections import OrderedDict
+
+
+class PatientCache:
+    """Ограниченный LRU-кэш профилей пациентов с TTL, ключ — telegram_id.
+
+    Кэш у каждого процесса свой. Изменения из других процессов приходят
+    через журнал patient_changes, который читается не чаще раза в
+    sync_interval секунд, — дольше этого чужое изменение не видно.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300,
+                 sync_interval: float = 1):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self.synced_at = float("-inf")
+        # Последняя учтённая запись patient_changes; None — ещё не читали
+        self.change_id = None
+        self._entries: OrderedDict = OrderedDict()
+        self._codes: dict = {}
+        self.hits = 0
+        self.misses = 0
+        # Растёт при каждой записи; не даёт читателю положить в кэш
+        # строку, прочитанную до параллельного обновления
+        self.version = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _fresh(self, telegram_id: int):
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            return None
+        patient, expires_at = entry
+        if expires_at < time.monotonic():
+            self._drop(telegram_id)
+            return None
+        self._entries.move_to_end(telegram_id)
+        return patient
+
+    def get(self, telegram_id: int):
+        patient = self._fresh(telegram_id)
+        if patient is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return patient
+
+    def get_by_code(self, patient_code: str):
+        telegram_id = self._codes.get(patient_code)
+        patient = self._fresh(telegram_id) if telegram_id is not None else None
+        if patient is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return patient
+
+    def put(self, patient: dict):
+        self.version += 1
+        self._store(patient)
+
+    def fill(self, patient: dict, version: int):
+        # Заполнение после промаха: только если с момента чтения не было записей
+        if version == self.version:
+            self._store(patient)
+
+    def _store(self, patient: dict):
+        telegram_id = patient["telegram_id"]
+        self._drop(telegram_id)
+        self._entries[telegram_id] = (patient, time.monotonic() + self.ttl)
+        self._codes[patient["patient_code"]] = telegram_id
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+    def update(self, telegram_id: int, **fields):
+        # Обновляем копию, чтобы не менять словарь, уже отданный обработчику
+        self.version += 1
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            self._store({**entry[0], **fields})
+
+    def invalidate(self, telegram_id: int):
+        self.version += 1
+        self._drop(telegram_id)
+
+    def clear(self):
+        self.version += 1
+        self._entries.clear()
+        self._codes.clear()
+
+    def sync_due(self) -> bool:
+        # Отмечаем начало синхронизации сразу, чтобы не запускать её параллельно
+        now = time.monotonic()
+        if now < self.synced_at + self.sync_interval:
+            return False
+        self.synced_at = now
+        return True
+
+    def apply_changes(self, rows: list, last_id: int | None):
+        # rows — (id, telegram_id) из patient_changes после change_id
+        lost = (
+            self.change_id is None
+            or (rows and rows[0][0] > self.change_id + 1)
+        )
+        if lost:
+            # Первый запуск или журнал уже обрезан — точечно сбросить нельзя
+            self.clear()
+        else:
+            for _, telegram_id in rows:
+                self.invalidate(telegram_id)
+        if rows:
+            self.change_id = rows[-1][0]
+        elif self.change_id is None:
+            self.change_id = last_id or 0
+
+    def _drop(self, telegram_id: int):
+        entry = self._entries.pop(telegram_id, None)
+        if entry is not None:
+            self._codes.pop(entry[0]["patient_code"], None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
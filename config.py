@@ -10,4 +10,29 @@ WEBHOOK_PATH = f"/webhook/{BOT_TOKEN}"
 WEBHOOK_URL = f"{WEBHOOK_HOST}{WEBHOOK_PATH}"
 WEBAPP_HOST = "0.0.0.0"
 WEBAPP_PORT = int(os.getenv("PORT", 8080))
-DB_PATH = "qamqor.db"
\ No newline at end of file
+# Свой адрес Bot API (локальный сервер или заглушка loadtest_webhook.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+# Пустое значение отключает /metrics
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+DB_PATH = "qamqor.db"
+DEV_MODE = os.getenv("DEV_MODE", "0") == "1"
+DB_READERS = int(os.getenv("DB_READERS", 4))
+DB_BATCH_WRITES = os.getenv("DB_BATCH_WRITES", "0") == "1"
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", 64))
+DB_BATCH_DELAY_MS = int(os.getenv("DB_BATCH_DELAY_MS", 20))
+PATIENT_CACHE_SIZE = int(os.getenv("PATIENT_CACHE_SIZE", 10000))
+PATIENT_CACHE_TTL = float(os.getenv("PATIENT_CACHE_TTL", 300))
+# Как часто проверять изменения пациентов из других процессов, секунды
+PATIENT_CACHE_SYNC = float(os.getenv("PATIENT_CACHE_SYNC", 1))
+SESSION_STORAGE = os.getenv("SESSION_STORAGE", "sqlite")
+SESSION_TTL = float(os.getenv("SESSION_TTL", 7200))
+SESSION_MAX = int(os.getenv("SESSION_MAX", 50000))
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", 30))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", 1))
+TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", 3))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+# Update дольше порога пишутся в лог с разбивкой по времени; 0 — отключено
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 2000))
+# Файл трасс Chrome Trace Event; пустое значение — не писать
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_SAMPLE = float(os.getenv("TRACE_SAMPLE", 0.01))
\ No newline at end of file
@@ -1,11 +1,221 @@
 import aiosqlite
 import asyncio
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from config import DB_PATH
+from config import (
+    DB_PATH, DB_READERS, DB_BATCH_SIZE, DB_BATCH_DELAY_MS,
+    PATIENT_CACHE_SIZE, PATIENT_CACHE_TTL, PATIENT_CACHE_SYNC
+)
+from cache import PatientCache
+from migrations import (
+    migrate, REBUILD_STATS_SQL, REBUILD_TRENDS_SQL, BACKFILL_ANSWERS_SQL
+)
+from answer_codec import encode_answers
+from metrics import timed
 
+# Настройки соединений: WAL позволяет читателям не ждать писателя.
+# synchronous=FULL — каждый commit сбрасывается в WAL через fsync, и записанное
+# переживает не только падение процесса, но и отключение питания; при
+# DB_BATCH_WRITES один fsync приходится на всю пачку записей
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = FULL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
 
+
+class ConnectionPool:
+    """Одно соединение-писатель и небольшой пул читателей на всё время работы бота."""
+
+    def __init__(self, path: str, readers: int = 4):
+        self.path = path
+        self.size = readers
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        self._readers: asyncio.Queue | None = None
+        self._all_readers: list = []
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.path)
+        conn.row_factory = aiosqlite.Row
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    async def open(self):
+        async with self._open_lock:
+            if self.is_open:
+                return
+            # Писатель открывается первым, чтобы включить WAL до читателей
+            self._writer = await self._connect()
+            self._readers = asyncio.Queue()
+            for _ in range(self.size):
+                conn = await self._connect()
+                self._all_readers.append(conn)
+                self._readers.put_nowait(conn)
+
+    async def close(self):
+        async with self._open_lock:
+            if not self.is_open:
+                return
+            async with self._write_lock:
+                for conn in self._all_readers:
+                    await conn.close()
+                self._all_readers.clear()
+                self._readers = None
+                await self._writer.close()
+                self._writer = None
+
+    @asynccontextmanager
+    async def read(self):
+        if not self.is_open:
+            await self.open()
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def write(self):
+        # Запись сериализуется: commit при успехе, rollback при ошибке
+        if not self.is_open:
+            await self.open()
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            await self._writer.commit()
+
+
+class WriteBatcher:
+    """Групповой commit: операции записи копятся в очереди и сбрасываются
+    одной транзакцией каждые max_rows операций или max_delay_ms миллисекунд."""
+
+    def __init__(self, max_rows: int = 64, max_delay_ms: int = 20):
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Дожидаемся сброса всего, что уже стоит в очереди
+        if not self.running:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def submit(self, op):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        batch = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                batch.append(item)
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        outcomes = []
+        try:
+            async with pool.write() as db:
+                # Без внешней транзакции каждый SAVEPOINT открывал свою,
+                # а RELEASE её коммитил; теперь commit один — в pool.write()
+                if not db.in_transaction:
+                    await db.execute("BEGIN")
+                for op, future in batch:
+                    # Ошибка одной операции не откатывает остальные
+                    await db.execute("SAVEPOINT batch_item")
+                    try:
+                        outcomes.append((future, await op(db), None))
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO batch_item")
+                        outcomes.append((future, None, e))
+                    await db.execute("RELEASE batch_item")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Вызывающие получают результат только после commit (и fsync, см. PRAGMAS)
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+pool = ConnectionPool(DB_PATH, DB_READERS)
+write_batcher = WriteBatcher(DB_BATCH_SIZE, DB_BATCH_DELAY_MS)
+patient_cache = PatientCache(PATIENT_CACHE_SIZE, PATIENT_CACHE_TTL, PATIENT_CACHE_SYNC)
+
+
+async def run_write(op):
+    # op(db) выполняется в транзакции писателя — через батчер, если он запущен
+    if write_batcher.running:
+        return await write_batcher.submit(op)
+    async with pool.write() as db:
+        return await op(db)
+
+
+@timed
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.write() as db:
+        # Создание таблиц и миграции — одна транзакция под блокировкой записи,
+        # commit делает pool.write()
+        await db.execute("BEGIN IMMEDIATE")
         await db.execute("""
             CREATE TABLE IF NOT EXISTS patients (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,151 +249,557 @@ async def init_db():
                 is_read INTEGER DEFAULT 0
             )
         """)
-        await db.commit()
+        await migrate(db)
 
 
+@timed
 async def register_patient(telegram_id: int, language: str) -> str:
-    async with aiosqlite.connect(DB_PATH) as db:
+    # Код берётся из patient_code_seq в том же INSERT, а триггер сдвигает
+    # последовательность — одна атомарная запись без гонок между процессами
+    async with pool.write() as db:
         cursor = await db.execute(
-            "SELECT patient_code FROM patients WHERE telegram_id = ?",
-            (telegram_id,)
+            """INSERT INTO patients (telegram_id, patient_code, language, consent_given, registered_at)
+               VALUES (?, (SELECT printf('%04d', value + 1) FROM patient_code_seq WHERE id = 1),
+                       ?, 1, ?)
+               ON CONFLICT (telegram_id) DO NOTHING
+               RETURNING *""",
+            (telegram_id, language, datetime.now().isoformat())
         )
-        row = await cursor.fetchone()
-        if row:
-            return row[0]
+        rows = await cursor.fetchall()
+        if not rows:
+            # Пациент уже зарегистрирован
+            cursor = await db.execute(
+                "SELECT * FROM patients WHERE telegram_id = ?",
+                (telegram_id,)
+            )
+            rows = await cursor.fetchall()
+        patient = dict(rows[0])
 
-        cursor = await db.execute("SELECT COUNT(*) FROM patients")
-        count = (await cursor.fetchone())[0]
-        patient_code = f"{count + 1:04d}"
+    patient_cache.put(patient)
+    return patient["patient_code"]
 
-        await db.execute(
-            """INSERT INTO patients (telegram_id, patient_code, language, consent_given, registered_at)
-               VALUES (?, ?, ?, 1, ?)""",
-            (telegram_id, patient_code, language, datetime.now().isoformat())
-        )
-        await db.commit()
-        return patient_code
+
+async def _sync_patient_cache():
+    # Сбрасываем из кэша пациентов, изменённых другими процессами
+    if not patient_cache.sync_due():
+        return
+    async with pool.read() as db:
+        if patient_cache.change_id is None:
+            cursor = await db.execute("SELECT MAX(id) FROM patient_changes")
+            last_id = (await cursor.fetchone())[0]
+            rows = []
+        else:
+            cursor = await db.execute(
+                "SELECT id, telegram_id FROM patient_changes WHERE id > ? ORDER BY id",
+                (patient_cache.change_id,)
+            )
+            rows = [tuple(row) for row in await cursor.fetchall()]
+            last_id = None
+    patient_cache.apply_changes(rows, last_id)
 
 
+@timed
 async def get_patient(telegram_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    await _sync_patient_cache()
+    patient = patient_cache.get(telegram_id)
+    if patient is not None:
+        return patient
+
+    version = patient_cache.version
+    async with pool.read() as db:
         cursor = await db.execute(
             "SELECT * FROM patients WHERE telegram_id = ?",
             (telegram_id,)
         )
-        return await cursor.fetchone()
+        row = await cursor.fetchone()
+    if row is None:
+        return None
+    patient = dict(row)
+    patient_cache.fill(patient, version)
+    return patient
 
 
-async def get_patient_language(telegram_id: int) -> str:
-    async with aiosqlite.connect(DB_PATH) as db:
+@timed
+async def get_patient_by_code(patient_code: str):
+    await _sync_patient_cache()
+    patient = patient_cache.get_by_code(patient_code)
+    if patient is not None:
+        return patient
+
+    version = patient_cache.version
+    async with pool.read() as db:
         cursor = await db.execute(
-            "SELECT language FROM patients WHERE telegram_id = ?",
-            (telegram_id,)
+            "SELECT * FROM patients WHERE patient_code = ?",
+            (patient_code,)
         )
         row = await cursor.fetchone()
-        return row[0] if row else "ru"
+    if row is None:
+        return None
+    patient = dict(row)
+    patient_cache.fill(patient, version)
+    return patient
 
 
+@timed
+async def get_patient_language(telegram_id: int) -> str:
+    patient = await get_patient(telegram_id)
+    return patient["language"] if patient else "ru"
+
+
+@timed
 async def update_language(telegram_id: int, language: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.write() as db:
         await db.execute(
             "UPDATE patients SET language = ? WHERE telegram_id = ?",
             (language, telegram_id)
         )
-        await db.commit()
+    patient_cache.update(telegram_id, language=language)
 
 
+@timed
 async def save_survey_result(telegram_id: int, survey_type: str,
-                              answers: list, total_score: int, level: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
+                              answers: list, total_score: int, level: str) -> int:
+    completed_at = datetime.now().isoformat()
+
+    async def op(db):
+        cursor = await db.execute(
             """INSERT INTO survey_results 
                (telegram_id, survey_type, answers, total_score, level, completed_at)
                VALUES (?, ?, ?, ?, ?, ?)""",
-            (telegram_id, survey_type, str(answers), total_score, level,
-             datetime.now().isoformat())
+            (telegram_id, survey_type, encode_answers(answers), total_score, level,
+             completed_at)
+        )
+        result_id = cursor.lastrowid
+        await db.executemany(
+            """INSERT INTO survey_answers (result_id, survey_type, item_idx, value)
+               VALUES (?, ?, ?, ?)""",
+            [(result_id, survey_type, i, value) for i, value in enumerate(answers)]
         )
-        await db.commit()
+        return result_id
+
+    return await run_write(op)
 
 
+@timed
 async def save_alert(telegram_id: int, patient_code: str,
-                     alert_type: str, question_answer: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
+                     alert_type: str, question_answer: int,
+                     notify_ids: list = (), notify_text: str = "") -> int:
+    # Сообщения для notify_ids ставятся в alerts_outbox в той же транзакции,
+    # доставляет их outbox.AlertOutbox
+    created_at = datetime.now().isoformat()
+
+    async def op(db):
+        cursor = await db.execute(
             """INSERT INTO alerts 
                (telegram_id, patient_code, alert_type, question_answer, created_at)
                VALUES (?, ?, ?, ?, ?)""",
             (telegram_id, patient_code, alert_type, question_answer,
-             datetime.now().isoformat())
+             created_at)
+        )
+        alert_id = cursor.lastrowid
+        await db.executemany(
+            """INSERT INTO alerts_outbox (alert_id, admin_id, text, next_attempt_at)
+               VALUES (?, ?, ?, ?)""",
+            [(alert_id, admin_id, notify_text, time.time()) for admin_id in notify_ids]
         )
-        await db.commit()
+        return alert_id
+
+    return await run_write(op)
+
 
+@timed
+async def claim_outbox(limit: int, lease: float):
+    # Забираем готовые к отправке сообщения и откладываем их на время lease,
+    # чтобы другой процесс не отправил их повторно
+    now = time.time()
 
-async def get_all_patients():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async def op(db):
         cursor = await db.execute(
-            "SELECT * FROM patients ORDER BY id"
+            """UPDATE alerts_outbox
+               SET attempts = attempts + 1, next_attempt_at = ?
+               WHERE id IN (
+                   SELECT id FROM alerts_outbox
+                   WHERE status = 'pending' AND next_attempt_at <= ?
+                   ORDER BY next_attempt_at LIMIT ?
+               )
+               RETURNING id, alert_id, admin_id, text, attempts""",
+            (now + lease, now, limit)
         )
         return await cursor.fetchall()
 
+    return await run_write(op)
 
-async def get_patient_results(patient_code: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+
+@timed
+async def mark_outbox_sent(outbox_id: int):
+    async def op(db):
+        await db.execute(
+            """UPDATE alerts_outbox SET status = 'sent', sent_at = ?, last_error = NULL
+               WHERE id = ?""",
+            (datetime.now().isoformat(), outbox_id)
+        )
+
+    await run_write(op)
+
+
+@timed
+async def reschedule_outbox(outbox_id: int, delay: float, error: str,
+                            failed: bool = False):
+    async def op(db):
+        await db.execute(
+            """UPDATE alerts_outbox
+               SET status = ?, next_attempt_at = ?, last_error = ?
+               WHERE id = ?""",
+            ("failed" if failed else "pending", time.time() + delay, error, outbox_id)
+        )
+
+    await run_write(op)
+
+
+@timed
+async def get_outbox_next_due():
+    async with pool.read() as db:
         cursor = await db.execute(
-            """SELECT sr.* FROM survey_results sr
-               JOIN patients p ON sr.telegram_id = p.telegram_id
-               WHERE p.patient_code = ?
-               ORDER BY sr.completed_at DESC""",
-            (patient_code,)
+            "SELECT MIN(next_attempt_at) FROM alerts_outbox WHERE status = 'pending'"
         )
+        return (await cursor.fetchone())[0]
+
+
+@timed
+async def get_outbox_backlog() -> int:
+    async with pool.read() as db:
+        cursor = await db.execute(
+            "SELECT COUNT(*) FROM alerts_outbox WHERE status = 'pending'"
+        )
+        return (await cursor.fetchone())[0]
+
+
+@timed
+async def get_item_distribution(survey_type: str) -> dict:
+    # {номер вопроса: {ответ: число ответов}} одним GROUP BY по индексу
+    async with pool.read() as db:
+        cursor = await db.execute(
+            """SELECT item_idx, value, COUNT(*) FROM survey_answers
+               WHERE survey_type = ?
+               GROUP BY item_idx, value""",
+            (survey_type,)
+        )
+        rows = await cursor.fetchall()
+    distribution = {}
+    for item_idx, value, count in rows:
+        distribution.setdefault(item_idx, {})[value] = count
+    return distribution
+
+
+@timed
+async def count_item_answers(survey_type: str, item_idx: int, min_value: int) -> int:
+    # Например: сколько ответов >= 2 на вопрос 3 GAD-7
+    async with pool.read() as db:
+        cursor = await db.execute(
+            """SELECT COUNT(*) FROM survey_answers
+               WHERE survey_type = ? AND item_idx = ? AND value >= ?""",
+            (survey_type, item_idx, min_value)
+        )
+        return (await cursor.fetchone())[0]
+
+
+@timed
+async def backfill_survey_answers() -> int:
+    # Досоздаёт строки survey_answers для результатов, у которых их нет
+    async with pool.write() as db:
+        cursor = await db.execute(BACKFILL_ANSWERS_SQL)
+        return cursor.rowcount
+
+
+@timed
+async def get_results_version() -> tuple:
+    # Меняется при каждом новом результате: (MAX(id), счётчик опросов)
+    async with pool.read() as db:
+        cursor = await db.execute(
+            """SELECT (SELECT MAX(id) FROM survey_results),
+                      (SELECT total_surveys FROM stats_counters WHERE id = 1)"""
+        )
+        return tuple(await cursor.fetchone())
+
+
+def _case(column: str, values: tuple) -> tuple:
+    # CASE column WHEN values[0] THEN 0 ... ELSE -1 END и его параметры
+    sql = f"CASE {column} {'WHEN ? THEN ? ' * len(values)}ELSE -1 END"
+    return sql, [item for code, value in enumerate(values) for item in (value, code)]
+
+
+@timed
+async def load_results_for_analytics(survey_type: str, levels: tuple) -> list:
+    # Результаты опросника одними целыми числами: telegram_id, балл, время
+    # (unix), упакованные ответы, номер уровня в levels (-1 — неизвестный).
+    # Строки — простые кортежи, без sqlite3.Row
+    level_sql, params = _case("level", levels)
+    async with pool.read() as db:
+        cursor = await db.execute(
+            f"""SELECT telegram_id, total_score,
+                       CAST(strftime('%s', completed_at) AS INTEGER), answers,
+                       {level_sql}
+                FROM survey_results WHERE survey_type = ?""",
+            (*params, survey_type)
+        )
+        cursor.row_factory = None
         return await cursor.fetchall()
 
 
-async def get_unread_alerts():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+@timed
+async def load_patient_languages(languages: tuple) -> list:
+    # (telegram_id, номер языка в languages) по возрастанию telegram_id
+    language_sql, params = _case("language", languages)
+    async with pool.read() as db:
         cursor = await db.execute(
-            "SELECT * FROM alerts WHERE is_read = 0 ORDER BY created_at DESC"
+            f"SELECT telegram_id, {language_sql} FROM patients ORDER BY telegram_id",
+            params
         )
+        cursor.row_factory = None
         return await cursor.fetchall()
 
 
-async def mark_alerts_read():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE alerts SET is_read = 1")
-        await db.commit()
+# Таблицы для выгрузки. Инкрементальная выгрузка идёт по id: id выдаются под блокировкой записи,
+# поэтому строка с меньшим id не может появиться после уже выгруженной
+EXPORT_TABLES = ("patients", "survey_results", "alerts")
 
 
-async def get_stats():
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("SELECT COUNT(*) FROM patients")
-        total_patients = (await cursor.fetchone())[0]
+@timed
+async def get_table_columns(table: str) -> list:
+    # [(имя, объявленный тип)] в порядке SELECT *
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"unknown table: {table}")
+    async with pool.read() as db:
+        cursor = await db.execute(f"PRAGMA table_info({table})")
+        return [(row["name"], row["type"].upper()) for row in await cursor.fetchall()]
 
-        cursor = await db.execute("SELECT COUNT(*) FROM survey_results")
-        total_surveys = (await cursor.fetchone())[0]
 
+async def iter_export_chunks(table: str, after_id: int = 0,
+                             chunk_size: int = 5000):
+    # Курсор читает строки с id > after_id частями по chunk_size в одном
+    # снимке WAL, целиком таблица в память не загружается
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"unknown table: {table}")
+    async with pool.read() as db:
         cursor = await db.execute(
-            "SELECT COUNT(*) FROM survey_results WHERE survey_type = 'GAD7'"
+            f"SELECT * FROM {table} WHERE id > ? ORDER BY id", (after_id,)
+        )
+        try:
+            while True:
+                rows = await cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [tuple(row) for row in rows]
+        finally:
+            await cursor.close()
+
+
+@timed
+async def get_patients_page(after_id: int = 0, before_id: int | None = None,
+                            limit: int = 30):
+    # Keyset-пагинация по id: стоимость страницы не зависит от размера таблицы.
+    # Возвращает (строки, есть_ли_ещё) — лишняя строка запрашивается как признак
+    async with pool.read() as db:
+        if before_id is None:
+            cursor = await db.execute(
+                "SELECT * FROM patients WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit + 1)
+            )
+            rows = await cursor.fetchall()
+        else:
+            cursor = await db.execute(
+                "SELECT * FROM patients WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before_id, limit + 1)
+            )
+            rows = (await cursor.fetchall())[::-1]
+    if before_id is None:
+        return rows[:limit], len(rows) > limit
+    return rows[-limit:], len(rows) > limit
+
+
+@timed
+async def get_patient_results(patient_code: str, limit: int | None = None,
+                              before_id: int | None = None,
+                              after_id: int | None = None,
+                              survey_type: str | None = None):
+    # Результаты от новых к старым. before_id/after_id — курсор: строки
+    # старше/новее результата с этим id (ключ (completed_at, id) по индексу)
+    # patient_code -> telegram_id берём из кэша, без JOIN с patients
+    patient = await get_patient_by_code(patient_code)
+    if patient is None:
+        return []
+
+    where = ["telegram_id = ?"]
+    params = [patient["telegram_id"]]
+    if survey_type is not None:
+        where.append("survey_type = ?")
+        params.append(survey_type)
+    order = "DESC"
+    if before_id is not None:
+        where.append(
+            "(completed_at, id) < (SELECT completed_at, id FROM survey_results WHERE id = ?)"
         )
-        gad7_count = (await cursor.fetchone())[0]
+        params.append(before_id)
+    elif after_id is not None:
+        where.append(
+            "(completed_at, id) > (SELECT completed_at, id FROM survey_results WHERE id = ?)"
+        )
+        params.append(after_id)
+        order = "ASC"
+
+    sql = f"""SELECT * FROM survey_results
+              WHERE {' AND '.join(where)}
+              ORDER BY completed_at {order}, id {order}"""
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    async with pool.read() as db:
+        cursor = await db.execute(sql, params)
+        rows = await cursor.fetchall()
+    return rows[::-1] if order == "ASC" else rows
+
+
+@timed
+async def get_patient_results_page(patient_code: str, page_size: int,
+                                   before_id: int | None = None,
+                                   after_id: int | None = None,
+                                   survey_type: str | None = None):
+    # Одна страница истории: (строки, есть_старее, есть_новее)
+    rows = await get_patient_results(
+        patient_code, limit=page_size + 1, before_id=before_id,
+        after_id=after_id, survey_type=survey_type
+    )
+    if after_id is not None:
+        return rows[-page_size:], True, len(rows) > page_size
+    return rows[:page_size], len(rows) > page_size, before_id is not None
 
+
+@timed
+async def get_patient_trends(telegram_id: int):
+    # Сводка по каждому опроснику пациента (ведёт триггер, миграция 9)
+    async with pool.read() as db:
         cursor = await db.execute(
-            "SELECT COUNT(*) FROM survey_results WHERE survey_type = 'PHQ9'"
+            "SELECT * FROM patient_trends WHERE telegram_id = ? ORDER BY survey_type",
+            (telegram_id,)
         )
-        phq9_count = (await cursor.fetchone())[0]
+        return await cursor.fetchall()
+
 
+@timed
+async def get_deteriorating_patients(limit: int = 30):
+    # Пациенты с ростом балла с прошлого опроса, сначала наибольший рост
+    async with pool.read() as db:
         cursor = await db.execute(
-            "SELECT COUNT(*) FROM alerts WHERE is_read = 0"
+            """SELECT t.*, p.patient_code FROM patient_trends t
+               JOIN patients p ON p.telegram_id = t.telegram_id
+               WHERE t.delta > 0
+               ORDER BY t.delta DESC, t.last_completed_at DESC
+               LIMIT ?""",
+            (limit,)
         )
-        unread_alerts = (await cursor.fetchone())[0]
+        return await cursor.fetchall()
+
+
+@timed
+async def get_alert_watermark(admin_id: int) -> int:
+    # id последнего оповещения, которое админ уже видел
+    async with pool.read() as db:
+        cursor = await db.execute(
+            "SELECT last_seen_id FROM admin_alert_cursors WHERE admin_id = ?",
+            (admin_id,)
+        )
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+@timed
+async def count_alerts_after(alert_id: int) -> int:
+    async with pool.read() as db:
+        cursor = await db.execute(
+            "SELECT COUNT(*) FROM alerts WHERE id > ?", (alert_id,)
+        )
+        return (await cursor.fetchone())[0]
+
+
+@timed
+async def get_alerts_page(after_id: int = 0, before_id: int | None = None,
+                          limit: int = 20):
+    # Keyset-пагинация по id, как get_patients_page: (строки по возрастанию id,
+    # есть_ли_ещё в направлении листания)
+    async with pool.read() as db:
+        if before_id is None:
+            cursor = await db.execute(
+                "SELECT * FROM alerts WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit + 1)
+            )
+            rows = await cursor.fetchall()
+        else:
+            cursor = await db.execute(
+                "SELECT * FROM alerts WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before_id, limit + 1)
+            )
+            rows = (await cursor.fetchall())[::-1]
+    if before_id is None:
+        return rows[:limit], len(rows) > limit
+    return rows[-limit:], len(rows) > limit
 
-        return {
-            "total_patients": total_patients,
-            "total_surveys": total_surveys,
-            "gad7_count": gad7_count,
-            "phq9_count": phq9_count,
-            "unread_alerts": unread_alerts
-        }
\ No newline at end of file
+
+@timed
+async def ack_alerts(admin_id: int, first_id: int, last_id: int) -> int:
+    # Отмечает прочитанными только показанный диапазон id (страница выбирается
+    # подряд по id, так что в диапазоне нет непоказанных оповещений) и сдвигает
+    # границу админа вперёд. Возвращает число впервые прочитанных.
+    # +is_read — чтобы планировщик шёл по диапазону rowid, а не по всем непрочитанным
+    async def op(db):
+        cursor = await db.execute(
+            "UPDATE alerts SET is_read = 1 WHERE id BETWEEN ? AND ? AND +is_read = 0",
+            (first_id, last_id)
+        )
+        await db.execute(
+            """INSERT INTO admin_alert_cursors (admin_id, last_seen_id, updated_at)
+               VALUES (?, ?, ?)
+               ON CONFLICT (admin_id) DO UPDATE SET
+                   last_seen_id = MAX(last_seen_id, excluded.last_seen_id),
+                   updated_at = excluded.updated_at""",
+            (admin_id, last_id, datetime.now().isoformat())
+        )
+        return cursor.rowcount
+
+    return await run_write(op)
+
+
+STATS_FIELDS = (
+    "total_patients", "total_surveys", "gad7_count", "phq9_count", "unread_alerts"
+)
+
+
+@timed
+async def get_stats():
+    # Счётчики ведут триггеры (миграция 2) — читаем одну строку
+    async with pool.read() as db:
+        cursor = await db.execute(
+            f"SELECT {', '.join(STATS_FIELDS)} FROM stats_counters WHERE id = 1"
+        )
+        row = await cursor.fetchone()
+    if row is None:
+        return dict.fromkeys(STATS_FIELDS, 0)
+    return dict(row)
+
+
+@timed
+async def rebuild_stats():
+    # Пересчитывает счётчики полным COUNT(*); возвращает значения до и после
+    async with pool.write() as db:
+        cursor = await db.execute(
+            f"SELECT {', '.join(STATS_FIELDS)} FROM stats_counters WHERE id = 1"
+        )
+        row = await cursor.fetchone()
+        before = dict(row) if row else dict.fromkeys(STATS_FIELDS, 0)
+        await db.execute(REBUILD_STATS_SQL)
+        await db.execute(REBUILD_TRENDS_SQL)
+        cursor = await db.execute(
+            f"SELECT {', '.join(STATS_FIELDS)} FROM stats_counters WHERE id = 1"
+        )
+        after = dict(await cursor.fetchone())
+    return before, after
\ No newline at end of file
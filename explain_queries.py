@@ -0,0 +1,136 @@
+"""Печатает EXPLAIN QUERY PLAN для каждого запроса из database.py.
+
+Все публичные функции database.py вызываются на временной базе с тестовыми
+аргументами, выполненные SQL-запросы перехватываются и для каждого
+уникального запроса выводится план. Если для обязательного параметра
+какой-то функции нет значения в SAMPLE_ARGS, скрипт завершается с ошибкой.
+Запуск: python explain_queries.py
+"""
+import asyncio
+import inspect
+import os
+import re
+import sys
+import tempfile
+
+import database
+
+# Тестовые значения по имени параметра
+SAMPLE_ARGS = {
+    "telegram_id": 1001,
+    "language": "ru",
+    "survey_type": "GAD7",
+    "answers": [1, 2, 0, 3, 1, 2, 1],
+    "total_score": 10,
+    "level": "moderate",
+    "patient_code": "0001",
+    "alert_type": "PHQ9_Q9_HIGH",
+    "question_answer": 2,
+    "item_idx": 2,
+    "min_value": 2,
+    "table": "survey_results",
+    "levels": ("minimal", "mild", "moderate", "severe"),
+    "languages": ("ru", "kz"),
+    "admin_id": 42,
+    "alert_id": 0,
+    "first_id": 1,
+    "last_id": 20,
+    "limit": 20,
+    "lease": 60,
+    "outbox_id": 1,
+    "delay": 30,
+    "error": "timeout",
+    "page_size": 5,
+}
+
+SKIP = {"init_db", "run_write"}
+PLANNED = re.compile(r"^\s*(SELECT|UPDATE|DELETE|INSERT|WITH)\b", re.IGNORECASE)
+
+
+def is_db_function(fn):
+    return inspect.iscoroutinefunction(fn) or inspect.isasyncgenfunction(fn)
+
+
+def db_functions():
+    for name, fn in inspect.getmembers(database, is_db_function):
+        if name.startswith("_") or name in SKIP or fn.__module__ != database.__name__:
+            continue
+        yield name, fn
+
+
+def call_args(fn):
+    kwargs = {}
+    for param in inspect.signature(fn).parameters.values():
+        if param.name in SAMPLE_ARGS:
+            kwargs[param.name] = SAMPLE_ARGS[param.name]
+        elif param.default is inspect.Parameter.empty:
+            return None
+    return kwargs
+
+
+async def collect(statements: dict):
+    await database.pool.open()
+    await database.init_db()
+
+    current = {"name": "register_patient"}
+
+    def trace(sql):
+        if PLANNED.match(sql):
+            statements.setdefault(" ".join(sql.split()), current["name"])
+
+    connections = [database.pool._writer, *database.pool._all_readers]
+    for conn in connections:
+        await conn.set_trace_callback(trace)
+
+    # Сначала регистрируем пациента, чтобы запросы чтения находили строки
+    await database.register_patient(SAMPLE_ARGS["telegram_id"], "ru")
+    database.patient_cache.clear()
+
+    skipped = []
+    for name, fn in db_functions():
+        kwargs = call_args(fn)
+        if kwargs is None:
+            skipped.append(name)
+            continue
+        current["name"] = name
+        if inspect.isasyncgenfunction(fn):
+            async for _ in fn(**kwargs):
+                pass
+        else:
+            await fn(**kwargs)
+        database.patient_cache.clear()
+
+    for conn in connections:
+        await conn.set_trace_callback(None)
+    return skipped
+
+
+async def explain(statements: dict):
+    async with database.pool.read() as db:
+        for sql, name in statements.items():
+            print(f"-- {name}\n{sql}")
+            cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plan = await cursor.fetchall()
+            for row in plan:
+                print(f"   {row['detail']}")
+            if not plan:
+                print("   (no plan)")
+            print()
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        database.pool.path = os.path.join(tmp, "explain.db")
+        statements: dict = {}
+        try:
+            skipped = await collect(statements)
+            await explain(statements)
+        finally:
+            await database.pool.close()
+
+    if skipped:
+        sys.exit(f"No sample args for: {', '.join(skipped)} — add them to SAMPLE_ARGS")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+"""Выгрузка данных исследования в CSV или Parquet.
+
+Таблицы patients, survey_results и alerts читаются курсором частями по
+EXPORT_CHUNK_SIZE строк и дописываются в файлы по мере чтения, затем
+упаковываются в один zip. С --after выгружаются только строки с id больше
+последнего выгруженного в каждой таблице; значение для следующей выгрузки
+печатается в конце.
+
+Запуск: python export.py [--format csv|parquet] [--out .]
+        [--after patients=120,survey_results=3400,alerts=15]
+"""
+import argparse
+import asyncio
+import csv
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+
+from database import (
+    pool, init_db, EXPORT_TABLES, get_table_columns, iter_export_chunks
+)
+from answer_codec import decode_answers
+from config import EXPORT_CHUNK_SIZE
+
+FORMATS = ("csv", "parquet")
+
+
+def parse_watermark(text: str) -> dict:
+    """"patients=120,alerts=15" -> {"patients": 120, "alerts": 15}."""
+    watermark = {}
+    for part in text.split(","):
+        table, _, last_id = part.partition("=")
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"unknown table: {table}")
+        watermark[table] = int(last_id)
+    return watermark
+
+
+def format_watermark(watermark: dict) -> str:
+    return ",".join(f"{table}={last_id}" for table, last_id in watermark.items())
+
+
+def _convert(table: str, names: list):
+    # Упакованные ответы выгружаются читаемой строкой "1,2,0,..."
+    if table != "survey_results" or "answers" not in names:
+        return None
+    idx = names.index("answers")
+
+    def convert(row):
+        row = list(row)
+        row[idx] = ",".join(map(str, decode_answers(row[idx])))
+        return row
+    return convert
+
+
+class _CsvWriter:
+    def __init__(self, path: str, columns: list):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([name for name, _ in columns])
+
+    def write(self, rows: list):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path: str, columns: list):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            (name, pa.int64() if "INT" in decl and name != "answers" else pa.string())
+            for name, decl in columns
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows: list):
+        # Каждая порция — отдельная row group
+        arrays = [
+            self._pa.array(values, type=field.type)
+            for values, field in zip(zip(*rows), self._schema)
+        ]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+_WRITERS = {"csv": _CsvWriter, "parquet": _ParquetWriter}
+
+
+async def export_table(table: str, path: str, fmt: str = "csv",
+                       after_id: int = 0,
+                       chunk_size: int = EXPORT_CHUNK_SIZE) -> tuple:
+    """Выгружает строки с id > after_id в файл, возвращает (число строк, последний id)."""
+    columns = await get_table_columns(table)
+    names = [name for name, _ in columns]
+    id_idx = names.index("id")
+    convert = _convert(table, names)
+
+    count, last_id = 0, after_id
+    # Запись в файл — в потоке, чтобы не блокировать цикл событий бота
+    writer = await asyncio.to_thread(_WRITERS[fmt], path, columns)
+    try:
+        async for rows in iter_export_chunks(table, after_id, chunk_size):
+            count += len(rows)
+            # Порции идут по возрастанию id
+            last_id = rows[-1][id_idx]
+            if convert:
+                rows = [convert(row) for row in rows]
+            await asyncio.to_thread(writer.write, rows)
+    finally:
+        await asyncio.to_thread(writer.close)
+    return count, last_id
+
+
+def _zip(path: str, files: list):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for file in files:
+            archive.write(file, os.path.basename(file))
+
+
+async def export_archive(out_dir: str, fmt: str = "csv", after: dict | None = None,
+                         chunk_size: int = EXPORT_CHUNK_SIZE) -> tuple:
+    """Выгружает все таблицы в zip в out_dir.
+
+    after — {таблица: последний выгруженный id}. Возвращает (путь к архиву,
+    {таблица: число строк}, {таблица: последний id}) — последнее значение
+    передаётся в after следующей выгрузки.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(out_dir, f"qamqor_export_{stamp}_{fmt}.zip")
+
+    after = after or {}
+    counts, watermark = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for table in EXPORT_TABLES:
+            file = os.path.join(tmp, f"{table}.{fmt}")
+            counts[table], watermark[table] = await export_table(
+                table, file, fmt, after.get(table, 0), chunk_size
+            )
+            files.append(file)
+        await asyncio.to_thread(_zip, path, files)
+    return path, counts, watermark
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument(
+        "--after", help="last exported ids, e.g. patients=120,survey_results=3400,alerts=15"
+    )
+    parser.add_argument("--out", default=".")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    after = None
+    if args.after:
+        try:
+            after = parse_watermark(args.after)
+        except ValueError:
+            parser.error("--after must look like patients=120,survey_results=3400,alerts=15")
+
+    await pool.open()
+    try:
+        await init_db()
+        path, counts, watermark = await export_archive(
+            args.out, args.format, after, args.chunk_size
+        )
+    finally:
+        await pool.close()
+
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+    print(path)
+    print(f"Next incremental export: --after {format_watermark(watermark)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
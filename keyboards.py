@@ -1,8 +1,11 @@
+from types import MappingProxyType
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+import texts
 from texts import get_text
 
 
-def language_keyboard():
+def _build_language_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(text="🇷🇺 Русский", callback_data="lang_ru"),
@@ -11,7 +14,7 @@ def language_keyboard():
     ])
 
 
-def consent_keyboard(lang: str):
+def _build_consent_keyboard(lang: str):
     return InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(
@@ -28,7 +31,7 @@ def consent_keyboard(lang: str):
     ])
 
 
-def main_menu_keyboard(lang: str):
+def _build_main_menu_keyboard(lang: str):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text=get_text(lang, "btn_gad7"),
@@ -55,7 +58,7 @@ def main_menu_keyboard(lang: str):
     ])
 
 
-def survey_answer_keyboard(lang: str, survey_type: str, question_idx: int):
+def _build_survey_answer_keyboard(lang: str, survey_type: str, question_idx: int):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text=f"0 — {get_text(lang, 'answer_0')}",
@@ -76,7 +79,7 @@ def survey_answer_keyboard(lang: str, survey_type: str, question_idx: int):
     ])
 
 
-def back_to_menu_keyboard(lang: str):
+def _build_back_to_menu_keyboard(lang: str):
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text=get_text(lang, "btn_menu"),
@@ -86,13 +89,17 @@ def back_to_menu_keyboard(lang: str):
 
 
 # Админ-клавиатуры
-def admin_keyboard():
+def _build_admin_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text="📊 Статистика", callback_data="admin_stats"
+        ), InlineKeyboardButton(
+            text="📈 Аналитика", callback_data="admin_analytics"
         )],
         [InlineKeyboardButton(
             text="👥 Список пациентов", callback_data="admin_patients"
+        ), InlineKeyboardButton(
+            text="📉 Ухудшение", callback_data="admin_worse"
         )],
         [InlineKeyboardButton(
             text="🔍 Результаты пациента", callback_data="admin_patient_results"
@@ -100,4 +107,88 @@ def admin_keyboard():
         [InlineKeyboardButton(
             text="🚨 Оповещения", callback_data="admin_alerts"
         )],
-    ])
\ No newline at end of file
+    ])
+
+
+# Набор клавиатур конечен (языки × опросники × вопросы + меню), поэтому все
+# они строятся один раз при импорте и дальше отдаются готовыми объектами.
+# Возвращаемые клавиатуры общие — изменять их нельзя.
+SURVEY_TYPES = ("gad7", "phq9")
+
+
+def _build_registry():
+    registry = {
+        "language": _build_language_keyboard(),
+        "admin": _build_admin_keyboard(),
+    }
+    for lang in texts.TEXTS:
+        registry["consent", lang] = _build_consent_keyboard(lang)
+        registry["main_menu", lang] = _build_main_menu_keyboard(lang)
+        registry["back_to_menu", lang] = _build_back_to_menu_keyboard(lang)
+        for survey_type in SURVEY_TYPES:
+            questions = get_text(lang, f"{survey_type}_questions")
+            for question_idx in range(len(questions)):
+                registry["survey", lang, survey_type, question_idx] = (
+                    _build_survey_answer_keyboard(lang, survey_type, question_idx)
+                )
+    return MappingProxyType(registry)
+
+
+KEYBOARDS = _build_registry()
+
+
+def language_keyboard():
+    return KEYBOARDS["language"]
+
+
+def consent_keyboard(lang: str):
+    keyboard = KEYBOARDS.get(("consent", lang))
+    return keyboard if keyboard is not None else _build_consent_keyboard(lang)
+
+
+def main_menu_keyboard(lang: str):
+    keyboard = KEYBOARDS.get(("main_menu", lang))
+    return keyboard if keyboard is not None else _build_main_menu_keyboard(lang)
+
+
+def survey_answer_keyboard(lang: str, survey_type: str, question_idx: int):
+    keyboard = KEYBOARDS.get(("survey", lang, survey_type, question_idx))
+    if keyboard is None:
+        keyboard = _build_survey_answer_keyboard(lang, survey_type, question_idx)
+    return keyboard
+
+
+def back_to_menu_keyboard(lang: str):
+    keyboard = KEYBOARDS.get(("back_to_menu", lang))
+    return keyboard if keyboard is not None else _build_back_to_menu_keyboard(lang)
+
+
+def pager_keyboard(prev_data: str | None, next_data: str | None,
+                   base: InlineKeyboardMarkup | None = None,
+                   prev_text: str = "⬅️ Назад", next_text: str = "Вперёд ➡️"):
+    # Ряд кнопок листания страниц над кнопками base
+    nav = []
+    if prev_data is not None:
+        nav.append(InlineKeyboardButton(text=prev_text, callback_data=prev_data))
+    if next_data is not None:
+        nav.append(InlineKeyboardButton(text=next_text, callback_data=next_data))
+    rows = [nav] if nav else []
+    if base is not None:
+        rows.extend(base.inline_keyboard)
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def results_keyboard(lang: str, newer_data: str | None, older_data: str | None):
+    if newer_data is None and older_data is None:
+        return back_to_menu_keyboard(lang)
+    return pager_keyboard(
+        newer_data, older_data, back_to_menu_keyboard(lang),
+        prev_text=get_text(lang, "btn_newer"), next_text=get_text(lang, "btn_older")
+    )
+
+
+def admin_keyboard(prev_data: str | None = None, next_data: str | None = None):
+    # С prev_data/next_data над меню добавляются кнопки листания страниц
+    if prev_data is None and next_data is None:
+        return KEYBOARDS["admin"]
+    return pager_keyboard(prev_data, next_data, KEYBOARDS["admin"])
\ No newline at end of file
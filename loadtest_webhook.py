@@ -0,0 +1,338 @@
+"""Нагрузочный тест через webhook: HTTP → aiogram → SQLite → Bot API.
+
+Две части:
+- FakeTelegramAPI — локальная заглушка Bot API на aiohttp. Записывает вызовы
+  sendMessage, editMessageText и answerCallbackQuery, умеет добавлять задержку
+  и отвечать 429 с заданной долей.
+- Driver — шлёт POST с update на путь SimpleRequestHandler из bot.py с заданной
+  частотой от имени тысяч пациентов. Каждый пациент проходит /start, язык,
+  согласие, GAD-7, PHQ-9 и «Мои результаты»; следующий шаг пациента
+  отправляется только после ответа бота на предыдущий.
+
+Задержка шага — от POST до вызова Bot API, которым бот ответил на этот update
+(answerCallbackQuery для кнопок, sendMessage для команд). По умолчанию бот
+поднимается в этом же процессе через bot.create_app на временной базе. С
+--target шлём во внешний бот; его нужно запустить с
+TELEGRAM_API_URL=http://127.0.0.1:<--api-port> и тем же BOT_TOKEN.
+
+Запуск: python loadtest_webhook.py [--patients 2000] [--rate 200] [--duration 60]
+        [--api-latency 50] [--api-429 0.01] [--tg-rate 1000]
+        [--target http://127.0.0.1:8080]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter, deque
+
+# config требует токен и список админов — для теста подходят любые
+os.environ.setdefault("BOT_TOKEN", "42:LOADTEST")
+os.environ.setdefault("ADMIN_IDS", "1")
+
+import aiohttp
+from aiohttp import web
+
+ITEMS = {"gad7": 7, "phq9": 9}
+RECORDED = {"sendMessage", "editMessageText", "answerCallbackQuery"}
+RETURNS_MESSAGE = {"sendMessage", "editMessageText", "sendDocument"}
+
+
+class FakeTelegramAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 limited_share: float = 0.0, retry_after: int = 1, on_call=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.limited_share = limited_share
+        self.retry_after = retry_after
+        self.on_call = on_call
+        self.calls = Counter()
+        self.limited = Counter()
+        self._message_id = 0
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"]
+        fields = await request.post()
+        self.calls[method] += 1
+
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        limited = method in RECORDED and random.random() < self.limited_share
+        if self.on_call is not None and method in RECORDED:
+            self.on_call(method, fields, limited)
+        if limited:
+            self.limited[method] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        result = True
+        if method in RETURNS_MESSAGE:
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id, "date": int(time.time()),
+                "chat": {"id": int(fields.get("chat_id") or 1), "type": "private"},
+                "text": fields.get("text", ""),
+            }
+        return web.json_response({"ok": True, "result": result})
+
+
+class Patient:
+    __slots__ = ("user_id", "steps", "step")
+
+    def __init__(self, user_id: int, rng: random.Random):
+        self.user_id = user_id
+        self.steps = [("message", "/start"), ("callback", rng.choice(("lang_ru", "lang_kz"))),
+                      ("callback", "consent_yes")]
+        for survey_type, items in ITEMS.items():
+            self.steps.append(("callback", f"start_{survey_type}"))
+            self.steps += [
+                ("callback", f"ans_{survey_type}_{idx}_{rng.randint(0, 3)}")
+                for idx in range(items)
+            ]
+        self.steps.append(("callback", "my_results"))
+        self.step = 0
+
+
+class Driver:
+    def __init__(self, url: str, patients: int, rate: float, timeout: float, seed: int):
+        rng = random.Random(seed)
+        self.url = url
+        self.rate = rate
+        self.timeout = timeout
+        self.ready = deque(Patient(200000 + n, rng) for n in range(patients))
+        self.pending_callbacks = {}
+        self.pending_messages = {}
+        self.latencies = []
+        self.post_latencies = []
+        self.sent = 0
+        self.answered = 0
+        self.limited = 0
+        self.http_errors = Counter()
+        self.timeouts = 0
+        self.stalls = 0
+        self.finished = 0
+        self._update_id = 0
+        self._tasks = set()
+
+    def _update(self, patient: Patient) -> dict:
+        self._update_id += 1
+        kind, data = patient.steps[patient.step]
+        user = {"id": patient.user_id, "is_bot": False, "first_name": "Load"}
+        message = {
+            "message_id": self._update_id, "date": int(time.time()),
+            "chat": {"id": patient.user_id, "type": "private"}, "from": user,
+        }
+        if kind == "message":
+            return {"update_id": self._update_id, "message": {**message, "text": data}}
+        return {"update_id": self._update_id, "callback_query": {
+            "id": str(self._update_id), "from": user, "chat_instance": "load",
+            "data": data, "message": {**message, "text": "load"},
+        }}
+
+    def on_api_call(self, method: str, fields, limited: bool):
+        # Первый ответ бота на update пациента завершает его шаг
+        if method == "answerCallbackQuery":
+            entry = self.pending_callbacks.pop(fields.get("callback_query_id"), None)
+        elif method == "sendMessage":
+            entry = self.pending_messages.pop(int(fields.get("chat_id") or 0), None)
+        else:
+            return
+        if entry is None:
+            return
+        patient, started = entry
+        self.latencies.append(time.perf_counter() - started)
+        self.answered += 1
+        self.limited += limited
+        self._advance(patient)
+
+    def _advance(self, patient: Patient):
+        patient.step += 1
+        if patient.step < len(patient.steps):
+            self.ready.append(patient)
+        else:
+            self.finished += 1
+
+    async def _post(self, http: aiohttp.ClientSession, patient: Patient):
+        update = self._update(patient)
+        started = time.perf_counter()
+        if "callback_query" in update:
+            self.pending_callbacks[update["callback_query"]["id"]] = (patient, started)
+        else:
+            self.pending_messages[patient.user_id] = (patient, started)
+        self.sent += 1
+        try:
+            async with http.post(self.url, json=update) as response:
+                await response.read()
+                if response.status != 200:
+                    self.http_errors[response.status] += 1
+        except aiohttp.ClientError as e:
+            self.http_errors[type(e).__name__] += 1
+        self.post_latencies.append(time.perf_counter() - started)
+
+    async def _expire(self):
+        # Шаги без ответа дольше timeout считаются ошибкой, пациент выбывает
+        while True:
+            await asyncio.sleep(0.5)
+            deadline = time.perf_counter() - self.timeout
+            for pending in (self.pending_callbacks, self.pending_messages):
+                for key, (_, started) in list(pending.items()):
+                    if started < deadline:
+                        del pending[key]
+                        self.timeouts += 1
+
+    def _pending(self) -> int:
+        return len(self.pending_callbacks) + len(self.pending_messages)
+
+    async def run(self, duration: float) -> float:
+        loop = asyncio.get_running_loop()
+        expirer = asyncio.create_task(self._expire())
+        started = loop.time()
+        next_at = started
+        async with aiohttp.ClientSession() as http:
+            while loop.time() - started < duration and (self.ready or self._pending()):
+                delay = next_at - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_at += 1 / self.rate
+                if not self.ready:
+                    # Нет пациента, готового к следующему шагу: бот не успевает отвечать
+                    self.stalls += 1
+                    continue
+                task = asyncio.create_task(self._post(http, self.ready.popleft()))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            elapsed = loop.time() - started
+            if self._tasks:
+                await asyncio.wait(self._tasks)
+        expirer.cancel()
+        return elapsed
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def report(driver: Driver, api: FakeTelegramAPI, elapsed: float, rate: float,
+           scheduler_stats: dict | None = None):
+    errors = sum(driver.http_errors.values()) + driver.timeouts
+    print(f"Offered rate:      {rate:.0f} updates/s for {elapsed:.1f}s")
+    print(f"Sent:              {driver.sent} ({driver.sent / elapsed:.0f}/s)")
+    print(f"Answered:          {driver.answered} ({driver.answered / elapsed:.0f}/s sustained)")
+    print(f"Patients finished: {driver.finished}")
+    print(
+        f"Errors:            {errors} ({errors / max(driver.sent, 1) * 100:.2f}%) — "
+        f"HTTP {dict(driver.http_errors)}, timeouts {driver.timeouts}"
+    )
+    print(f"Stalls:            {driver.stalls} (no patient ready to send)")
+    for name, values in (("Response", driver.latencies), ("HTTP POST", driver.post_latencies)):
+        print(
+            f"{name + ' ms:':<19}p50 {percentile(values, 50) * 1000:.1f}  "
+            f"p95 {percentile(values, 95) * 1000:.1f}  "
+            f"p99 {percentile(values, 99) * 1000:.1f}  "
+            f"max {max(values, default=0) * 1000:.1f}"
+        )
+    print(f"Bot API calls:     {dict(api.calls)}")
+    if api.limited:
+        print(f"Injected 429:      {dict(api.limited)}")
+    if scheduler_stats:
+        # Исходящие лимиты бота (TG_GLOBAL_RATE / TG_CHAT_RATE) тоже входят в задержку
+        print(f"Send scheduler:    {scheduler_stats}")
+
+
+async def start_site(app: web.Application, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def run(args):
+    from config import WEBHOOK_PATH
+
+    api = FakeTelegramAPI(
+        args.api_latency / 1000, args.api_jitter / 1000, args.api_429, args.retry_after
+    )
+    api_runner = await start_site(api.app, "127.0.0.1", args.api_port)
+    api_url = f"http://127.0.0.1:{args.api_port}"
+
+    bot_runner = None
+    scheduler_stats = None
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            if args.target:
+                target = args.target.rstrip("/")
+            else:
+                # Бот в этом же процессе: тот же create_app, что и в bot.py
+                from aiogram.client.session.aiohttp import AiohttpSession
+                from aiogram.client.telegram import TelegramAPIServer
+
+                import database
+                from bot import create_bot, create_dispatcher, create_app
+
+                database.pool.path = os.path.join(tmp, "loadtest.db")
+                bot = create_bot(AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+                app = create_app(bot, create_dispatcher())
+                bot_runner = await start_site(app, "127.0.0.1", args.bot_port)
+                target = f"http://127.0.0.1:{args.bot_port}"
+
+            driver = Driver(
+                target + WEBHOOK_PATH, args.patients, args.rate, args.timeout, args.seed
+            )
+            api.on_call = driver.on_api_call
+            elapsed = await driver.run(args.duration)
+            # Дожидаемся ответов на уже отправленные update
+            deadline = time.perf_counter() + args.timeout
+            while driver._pending() and time.perf_counter() < deadline:
+                await asyncio.sleep(0.1)
+            if bot_runner is not None:
+                from throttling import send_scheduler
+                scheduler_stats = send_scheduler.stats()
+        finally:
+            if bot_runner is not None:
+                await bot_runner.cleanup()
+            await api_runner.cleanup()
+
+    report(driver, api, elapsed, args.rate, scheduler_stats)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200, help="updates per second")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--timeout", type=float, default=10, help="seconds per step")
+    parser.add_argument("--api-latency", type=float, default=50, help="ms")
+    parser.add_argument("--api-jitter", type=float, default=20, help="ms")
+    parser.add_argument("--api-429", type=float, default=0.0, help="share of 429 answers")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--bot-port", type=int, default=8080)
+    parser.add_argument("--target", help="external bot base URL")
+    parser.add_argument(
+        "--tg-rate", type=float,
+        help="override TG_GLOBAL_RATE of the in-process bot (Telegram allows ~30/s)"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.tg_rate:
+        os.environ["TG_GLOBAL_RATE"] = str(args.tg_rate)
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
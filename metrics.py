@@ -0,0 +1,226 @@
+# Метрики в текстовом формате Prometheus для /metrics.
+#
+# Все обновления идут из цикла событий, поэтому обходятся без блокировок:
+# счётчик — элемент словаря, гистограмма — список счётчиков по корзинам.
+# Дорогие значения (сессии, очередь outbox) считаются только при запросе
+# /metrics через зарегистрированные сборщики.
+import inspect
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+
+from tracing import record_span
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        return [
+            f"{self.name}{_labels(self.labels, key)} {value}"
+            for key, value in self.values.items()
+        ]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (),
+                 buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [счётчики по корзинам (последняя — +Inf), сумма]
+        self.series: dict = {}
+
+    def observe(self, value: float, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list:
+        lines = []
+        for key, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _labels(self.labels, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # name -> (help, тип, функция без аргументов -> число или awaitable)
+        self.collectors: dict = {}
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, name: str, help: str, collect, kind: str = "gauge"):
+        # Повторная регистрация заменяет прежний сборщик
+        self.collectors[name] = (help, kind, collect)
+
+    async def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for name, (help, kind, collect) in self.collectors.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            value = collect()
+            if inspect.isawaitable(value):
+                value = await value
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+updates_total = registry.counter(
+    "qamqor_updates_total", "Telegram updates received, by type", ("type",)
+)
+handler_seconds = registry.histogram(
+    "qamqor_handler_seconds", "Handler latency", ("handler",)
+)
+handler_errors_total = registry.counter(
+    "qamqor_handler_errors_total", "Handler exceptions", ("handler",)
+)
+db_seconds = registry.histogram(
+    "qamqor_db_seconds", "database.py call latency", ("function",), DB_BUCKETS
+)
+db_errors_total = registry.counter(
+    "qamqor_db_errors_total", "database.py call exceptions", ("function",)
+)
+telegram_api_seconds = registry.histogram(
+    "qamqor_telegram_api_seconds", "Outbound Bot API call latency", ("method",)
+)
+send_wait_seconds = registry.histogram(
+    "qamqor_send_wait_seconds", "Time Bot API requests waited for send scheduler rate limits",
+    ("priority",)
+)
+telegram_api_errors_total = registry.counter(
+    "qamqor_telegram_api_errors_total", "Outbound Bot API errors", ("method", "error")
+)
+
+
+# Глубина вложенных вызовов @timed: get_patient_language вызывает get_patient и т. п.
+_db_depth: ContextVar[int] = ContextVar("db_depth", default=0)
+
+
+def timed(fn):
+    """Декоратор для обращений к SQLite (database.py, SQLiteStorage): время и ошибки по имени функции."""
+    name = fn.__qualname__
+
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        depth = _db_depth.get()
+        token = _db_depth.set(depth + 1)
+        started = time.perf_counter()
+        error = None
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            db_errors_total.inc(name)
+            raise
+        finally:
+            ended = time.perf_counter()
+            _db_depth.reset(token)
+            db_seconds.observe(ended - started, name)
+            record_span("db", name, started, ended, error, depth)
+    return wrapper
+
+
+class UpdateMetrics(BaseMiddleware):
+    # Внешний middleware на dp.update
+    async def __call__(self, handler, event, data):
+        updates_total.inc(event.event_type)
+        return await handler(event, data)
+
+
+class HandlerMetrics(BaseMiddleware):
+    # Внутренний middleware: известен выбранный обработчик
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = type(e).__name__
+            handler_errors_total.inc(name)
+            raise
+        finally:
+            ended = time.perf_counter()
+            handler_seconds.observe(ended - started, name)
+            record_span("handler", name, started, ended, error)
+
+
+class TelegramAPIMetrics(BaseRequestMiddleware):
+    # Регистрируется после send_scheduler, поэтому меряет сам запрос без ожидания в очереди
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        error = None
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            error = type(e).__name__
+            telegram_api_errors_total.inc(name, error)
+            raise
+        finally:
+            ended = time.perf_counter()
+            telegram_api_seconds.observe(ended - started, name)
+            record_span("telegram", name, started, ended, error)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        text=await registry.render(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
\ No newline at end of file
@@ -0,0 +1,317 @@
+import ast
+import logging
+
+from answer_codec import encode_answers, BITS, MASK, MAX_ITEMS, COUNT_SHIFT
+
+logger = logging.getLogger(__name__)
+
+# Пересчёт счётчиков с нуля: используется миграцией и rebuild_stats()
+REBUILD_STATS_SQL = """
+    INSERT OR REPLACE INTO stats_counters
+        (id, total_patients, total_surveys, gad7_count, phq9_count, unread_alerts)
+    SELECT 1,
+        (SELECT COUNT(*) FROM patients),
+        (SELECT COUNT(*) FROM survey_results),
+        (SELECT COUNT(*) FROM survey_results WHERE survey_type = 'GAD7'),
+        (SELECT COUNT(*) FROM survey_results WHERE survey_type = 'PHQ9'),
+        (SELECT COUNT(*) FROM alerts WHERE is_read = 0)
+"""
+
+# Сводка по пациенту и опроснику с нуля по всей истории (окна нужны только
+# здесь; при обычной записи строку обновляет триггер trg_patient_trends)
+REBUILD_TRENDS_SQL = """
+    INSERT OR REPLACE INTO patient_trends
+        (telegram_id, survey_type, last_score, prev_score, delta, mean_score,
+         count, last_completed_at)
+    SELECT telegram_id, survey_type, total_score, prev_score,
+           total_score - prev_score, mean_score, count, completed_at
+    FROM (
+        SELECT telegram_id, survey_type, total_score, completed_at,
+               LAG(total_score) OVER history AS prev_score,
+               AVG(total_score) OVER patient AS mean_score,
+               COUNT(*) OVER patient AS count,
+               ROW_NUMBER() OVER (
+                   PARTITION BY telegram_id, survey_type
+                   ORDER BY completed_at DESC, id DESC
+               ) AS rn
+        FROM survey_results
+        WINDOW patient AS (PARTITION BY telegram_id, survey_type),
+               history AS (PARTITION BY telegram_id, survey_type ORDER BY completed_at, id)
+    )
+    WHERE rn = 1
+"""
+
+# Раскладывает упакованные ответы (answer_codec) по строкам survey_answers.
+# Идемпотентен: уже разложенные результаты пропускаются
+BACKFILL_ANSWERS_SQL = f"""
+    WITH RECURSIVE items(i) AS (
+        SELECT 0 UNION ALL SELECT i + 1 FROM items WHERE i < {MAX_ITEMS - 1}
+    )
+    INSERT OR IGNORE INTO survey_answers (result_id, survey_type, item_idx, value)
+    SELECT r.id, r.survey_type, items.i, (r.answers >> ({BITS} * items.i)) & {MASK}
+    FROM survey_results r
+    JOIN items ON items.i < ((r.answers >> {COUNT_SHIFT}) & 15)
+    WHERE NOT EXISTS (SELECT 1 FROM survey_answers a WHERE a.result_id = r.id)
+"""
+
+
+async def _pack_legacy_answers(db):
+    # "[0, 1, 3, ...]" -> упакованный INTEGER, порциями по id
+    last_id = 0
+    while True:
+        cursor = await db.execute(
+            """SELECT id, answers FROM survey_results
+               WHERE id > ? ORDER BY id LIMIT 1000""",
+            (last_id,)
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            return
+        await db.executemany(
+            "UPDATE survey_results SET answers_packed = ? WHERE id = ?",
+            [(encode_answers(ast.literal_eval(answers)), row_id)
+             for row_id, answers in rows]
+        )
+        last_id = rows[-1][0]
+
+
+# Версия схемы хранится в PRAGMA user_version.
+# Миграция N — это список шагов: SQL-строка или async-функция step(db).
+# Уже выпущенные миграции не редактируются, только добавляются новые.
+MIGRATIONS = [
+    # 1: индексы для истории пациента, подсчёта по типам и ленты оповещений
+    [
+        """CREATE INDEX IF NOT EXISTS idx_survey_results_patient
+           ON survey_results (telegram_id, completed_at)""",
+        """CREATE INDEX IF NOT EXISTS idx_survey_results_type
+           ON survey_results (survey_type)""",
+        """CREATE INDEX IF NOT EXISTS idx_alerts_unread
+           ON alerts (is_read, created_at)""",
+    ],
+    # 2: счётчики для get_stats, поддерживаются триггерами в той же транзакции
+    [
+        """CREATE TABLE IF NOT EXISTS stats_counters (
+               id INTEGER PRIMARY KEY CHECK (id = 1),
+               total_patients INTEGER NOT NULL DEFAULT 0,
+               total_surveys INTEGER NOT NULL DEFAULT 0,
+               gad7_count INTEGER NOT NULL DEFAULT 0,
+               phq9_count INTEGER NOT NULL DEFAULT 0,
+               unread_alerts INTEGER NOT NULL DEFAULT 0
+           )""",
+        """CREATE TRIGGER IF NOT EXISTS trg_patients_count_insert
+           AFTER INSERT ON patients BEGIN
+               UPDATE stats_counters SET total_patients = total_patients + 1
+               WHERE id = 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_patients_count_delete
+           AFTER DELETE ON patients BEGIN
+               UPDATE stats_counters SET total_patients = total_patients - 1
+               WHERE id = 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_surveys_count_insert
+           AFTER INSERT ON survey_results BEGIN
+               UPDATE stats_counters SET
+                   total_surveys = total_surveys + 1,
+                   gad7_count = gad7_count + (NEW.survey_type = 'GAD7'),
+                   phq9_count = phq9_count + (NEW.survey_type = 'PHQ9')
+               WHERE id = 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_surveys_count_delete
+           AFTER DELETE ON survey_results BEGIN
+               UPDATE stats_counters SET
+                   total_surveys = total_surveys - 1,
+                   gad7_count = gad7_count - (OLD.survey_type = 'GAD7'),
+                   phq9_count = phq9_count - (OLD.survey_type = 'PHQ9')
+               WHERE id = 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_alerts_count_insert
+           AFTER INSERT ON alerts WHEN NEW.is_read = 0 BEGIN
+               UPDATE stats_counters SET unread_alerts = unread_alerts + 1
+               WHERE id = 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_alerts_count_update
+           AFTER UPDATE OF is_read ON alerts
+           WHEN (OLD.is_read = 0) != (NEW.is_read = 0) BEGIN
+               UPDATE stats_counters SET
+                   unread_alerts = unread_alerts + (NEW.is_read = 0) - (OLD.is_read = 0)
+               WHERE id = 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_alerts_count_delete
+           AFTER DELETE ON alerts WHEN OLD.is_read = 0 BEGIN
+               UPDATE stats_counters SET unread_alerts = unread_alerts - 1
+               WHERE id = 1;
+           END""",
+        # Начальные значения для уже существующих данных
+        REBUILD_STATS_SQL,
+    ],
+    # 3: последовательность для patient_code вместо COUNT(*) при регистрации
+    [
+        """CREATE TABLE IF NOT EXISTS patient_code_seq (
+               id INTEGER PRIMARY KEY CHECK (id = 1),
+               value INTEGER NOT NULL
+           )""",
+        """INSERT OR IGNORE INTO patient_code_seq (id, value)
+           SELECT 1, COALESCE(MAX(CAST(patient_code AS INTEGER)), 0)
+           FROM patients""",
+        """CREATE TRIGGER IF NOT EXISTS trg_patient_code_seq
+           AFTER INSERT ON patients BEGIN
+               UPDATE patient_code_seq SET value = value + 1 WHERE id = 1;
+           END""",
+    ],
+    # 4: сессии FSM (незавершённые опросы), см. storage.SQLiteStorage
+    [
+        """CREATE TABLE IF NOT EXISTS fsm_sessions (
+               key TEXT PRIMARY KEY,
+               state TEXT,
+               data TEXT NOT NULL DEFAULT '{}',
+               updated_at REAL NOT NULL
+           ) WITHOUT ROWID""",
+    ],
+    # 5: очередь доставки оповещений админам, см. outbox.AlertOutbox
+    [
+        """CREATE TABLE IF NOT EXISTS alerts_outbox (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               alert_id INTEGER NOT NULL REFERENCES alerts(id),
+               admin_id INTEGER NOT NULL,
+               text TEXT NOT NULL,
+               status TEXT NOT NULL DEFAULT 'pending',
+               attempts INTEGER NOT NULL DEFAULT 0,
+               next_attempt_at REAL NOT NULL,
+               last_error TEXT,
+               sent_at TEXT
+           )""",
+        """CREATE INDEX IF NOT EXISTS idx_alerts_outbox_due
+           ON alerts_outbox (status, next_attempt_at)""",
+    ],
+    # 6: survey_results.answers — упакованный INTEGER вместо repr списка,
+    # см. answer_codec
+    [
+        "ALTER TABLE survey_results ADD COLUMN answers_packed INTEGER",
+        _pack_legacy_answers,
+        "ALTER TABLE survey_results DROP COLUMN answers",
+        "ALTER TABLE survey_results RENAME COLUMN answers_packed TO answers",
+    ],
+    # 7: ответы по вопросам для анализа на уровне SQL
+    [
+        """CREATE TABLE IF NOT EXISTS survey_answers (
+               result_id INTEGER NOT NULL REFERENCES survey_results(id),
+               survey_type TEXT NOT NULL,
+               item_idx INTEGER NOT NULL,
+               value INTEGER NOT NULL,
+               PRIMARY KEY (result_id, item_idx)
+           ) WITHOUT ROWID""",
+        """CREATE INDEX IF NOT EXISTS idx_survey_answers_item
+           ON survey_answers (survey_type, item_idx, value)""",
+        BACKFILL_ANSWERS_SQL,
+    ],
+    # 8: пустая — выгрузка идёт по id, индексы по времени не нужны;
+    # номер сохранён, чтобы не сдвигать последующие версии
+    [],
+    # 9: динамика баллов по пациенту и опроснику
+    [
+        """CREATE TABLE IF NOT EXISTS patient_trends (
+               telegram_id INTEGER NOT NULL,
+               survey_type TEXT NOT NULL,
+               last_score INTEGER NOT NULL,
+               prev_score INTEGER,
+               delta INTEGER,
+               mean_score REAL NOT NULL,
+               count INTEGER NOT NULL,
+               last_completed_at TEXT NOT NULL,
+               PRIMARY KEY (telegram_id, survey_type)
+           ) WITHOUT ROWID""",
+        """CREATE INDEX IF NOT EXISTS idx_patient_trends_delta
+           ON patient_trends (delta, last_completed_at)""",
+        # В UPDATE все столбцы справа — значения до обновления
+        """CREATE TRIGGER IF NOT EXISTS trg_patient_trends
+           AFTER INSERT ON survey_results
+           BEGIN
+               INSERT INTO patient_trends
+                   (telegram_id, survey_type, last_score, prev_score, delta,
+                    mean_score, count, last_completed_at)
+               VALUES (NEW.telegram_id, NEW.survey_type, NEW.total_score, NULL, NULL,
+                       NEW.total_score, 1, NEW.completed_at)
+               ON CONFLICT (telegram_id, survey_type) DO UPDATE SET
+                   prev_score = last_score,
+                   last_score = excluded.last_score,
+                   delta = excluded.last_score - last_score,
+                   mean_score = (mean_score * count + excluded.last_score) / (count + 1),
+                   count = count + 1,
+                   last_completed_at = excluded.last_completed_at;
+           END""",
+        REBUILD_TRENDS_SQL,
+    ],
+    # 10: граница просмотренных оповещений для каждого админа
+    [
+        """CREATE TABLE IF NOT EXISTS admin_alert_cursors (
+               admin_id INTEGER PRIMARY KEY,
+               last_seen_id INTEGER NOT NULL DEFAULT 0,
+               updated_at TEXT NOT NULL
+           )""",
+    ],
+    # 11: журнал изменений patients — по нему другие процессы сбрасывают
+    # свои кэши пациентов; хранятся последние 1000 записей
+    [
+        """CREATE TABLE IF NOT EXISTS patient_changes (
+               id INTEGER PRIMARY KEY,
+               telegram_id INTEGER NOT NULL
+           )""",
+        """CREATE TRIGGER IF NOT EXISTS trg_patient_changes_update
+           AFTER UPDATE ON patients BEGIN
+               INSERT INTO patient_changes (telegram_id) VALUES (OLD.telegram_id);
+               DELETE FROM patient_changes
+               WHERE id <= (SELECT MAX(id) FROM patient_changes) - 1000;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_patient_changes_delete
+           AFTER DELETE ON patients BEGIN
+               INSERT INTO patient_changes (telegram_id) VALUES (OLD.telegram_id);
+               DELETE FROM patient_changes
+               WHERE id <= (SELECT MAX(id) FROM patient_changes) - 1000;
+           END""",
+    ],
+    # 12: удаление сессий FSM, простаивающих дольше SESSION_TTL
+    [
+        "CREATE INDEX IF NOT EXISTS idx_fsm_sessions_updated ON fsm_sessions (updated_at)",
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def get_schema_version(db) -> int:
+    cursor = await db.execute("PRAGMA user_version")
+    return (await cursor.fetchone())[0]
+
+
+async def migrate(db) -> int:
+    # Версия читается уже под блокировкой записи: иначе несколько процессов,
+    # стартующих одновременно, видят одну и ту же старую версию и повторяют
+    # миграции, которые другой процесс уже применил
+    if not db.in_transaction:
+        await db.execute("BEGIN IMMEDIATE")
+    current = await get_schema_version(db)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Schema version {current} is newer than this build ({SCHEMA_VERSION})"
+        )
+
+    for version, steps in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        # Каждая миграция применяется атомарно вместе с новой версией схемы
+        await db.execute("SAVEPOINT migration")
+        try:
+            for step in steps:
+                if callable(step):
+                    await step(db)
+                else:
+                    await db.execute(step)
+            await db.execute(f"PRAGMA user_version = {version}")
+        except BaseException:
+            await db.execute("ROLLBACK TO migration")
+            await db.execute("RELEASE migration")
+            raise
+        await db.execute("RELEASE migration")
+        logger.info(f"Applied migration {version}")
+
+    return SCHEMA_VERSION
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+)
+
+from database import (
+    claim_outbox, mark_outbox_sent, reschedule_outbox, get_outbox_next_due
+)
+from throttling import send_priority, ALERT
+
+logger = logging.getLogger(__name__)
+
+
+class AlertOutbox:
+    """Фоновая доставка оповещений из alerts_outbox.
+
+    Сообщения отправляются всем админам параллельно; при ошибке — повтор
+    с экспоненциальной задержкой, при 429 — через retry_after от Telegram.
+    """
+
+    def __init__(self, poll_interval: float = 5, batch_size: int = 50,
+                 max_attempts: int = 8, base_delay: float = 2,
+                 max_delay: float = 600, lease: float = 60):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self._bot: Bot | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Упавшая задача не должна мешать остальному on_shutdown
+            logger.exception("Alert outbox: dispatcher task failed")
+        self._task = None
+
+    def notify(self):
+        # Будит диспетчер сразу после save_alert, не дожидаясь опроса
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                rows = await claim_outbox(self.batch_size, self.lease)
+            except Exception:
+                logger.exception("Alert outbox: failed to claim messages")
+                rows = []
+
+            if rows:
+                await asyncio.gather(*(self._deliver(row) for row in rows))
+                continue
+
+            # Спим до ближайшего повтора, но не дольше poll_interval
+            timeout = self.poll_interval
+            try:
+                next_due = await get_outbox_next_due()
+            except Exception:
+                next_due = None
+            if next_due is not None:
+                timeout = min(timeout, max(next_due - time.time(), 0))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _deliver(self, row):
+        # Ошибка учёта (например, database is locked) не должна останавливать
+        # диспетчер: аренда истечёт, и строка будет взята повторно
+        try:
+            await self._send(row)
+        except Exception:
+            logger.exception(f"Alert outbox: failed to update message {row['id']}")
+
+    async def _send(self, row):
+        outbox_id, attempts = row["id"], row["attempts"]
+        try:
+            with send_priority(ALERT):
+                await self._bot.send_message(
+                    row["admin_id"], row["text"], parse_mode="HTML"
+                )
+        except TelegramRetryAfter as e:
+            await reschedule_outbox(outbox_id, e.retry_after, str(e))
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Админ заблокировал бота или чат не найден — повтор не поможет
+            logger.error(f"Alert {row['alert_id']} to {row['admin_id']} failed: {e}")
+            await reschedule_outbox(outbox_id, 0, str(e), failed=True)
+        except Exception as e:
+            failed = attempts >= self.max_attempts
+            delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+            if failed:
+                logger.error(f"Alert {row['alert_id']} to {row['admin_id']} "
+                             f"gave up after {attempts} attempts: {e}")
+                await reschedule_outbox(outbox_id, 0, str(e), failed=True)
+            else:
+                await reschedule_outbox(outbox_id, delay, str(e))
+        else:
+            await mark_outbox_sent(outbox_id)
+
+
+alert_outbox = AlertOutbox()
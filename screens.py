@@ -0,0 +1,68 @@
+import importlib
+import logging
+import os
+from types import MappingProxyType
+
+import keyboards
+import texts
+from config import DEV_MODE
+from texts import get_text
+
+logger = logging.getLogger(__name__)
+
+# Экран вопроса зависит только от (язык, опросник, номер вопроса), поэтому
+# текст и клавиатура всех экранов готовятся заранее: (text, reply_markup).
+
+
+def _build_screens():
+    screens = {}
+    counts = {}
+    for lang in texts.TEXTS:
+        for survey_type in keyboards.SURVEY_TYPES:
+            questions = get_text(lang, f"{survey_type}_questions")
+            intro = get_text(lang, f"{survey_type}_intro")
+            total = len(questions)
+            counts[lang, survey_type] = total
+            for question_idx, question_text in enumerate(questions):
+                text = intro.format(current=question_idx + 1, total=total)
+                screens[lang, survey_type, question_idx] = (
+                    f"{text}\n\n<b>{question_text}</b>",
+                    keyboards.survey_answer_keyboard(lang, survey_type, question_idx),
+                )
+    return MappingProxyType(screens), MappingProxyType(counts)
+
+
+SCREENS, QUESTION_COUNTS = _build_screens()
+_texts_mtime = os.path.getmtime(texts.__file__)
+
+
+def _reload_if_changed():
+    # Только в DEV_MODE: правки texts.py подхватываются без перезапуска
+    global SCREENS, QUESTION_COUNTS, _texts_mtime
+    mtime = os.path.getmtime(texts.__file__)
+    if mtime == _texts_mtime:
+        return
+    _texts_mtime = mtime
+    importlib.reload(texts)
+    for error in texts.validate_texts(texts.TEXTS):
+        logger.error(f"texts.py: {error}")
+    keyboards.KEYBOARDS = keyboards._build_registry()
+    SCREENS, QUESTION_COUNTS = _build_screens()
+    logger.info("texts.py changed, question screens rebuilt")
+
+
+def _lang(lang: str) -> str:
+    # get_text для неизвестного языка отдаёт русские тексты
+    return lang if lang in texts.TEXTS else "ru"
+
+
+def question_screen(lang: str, survey_type: str, question_idx: int):
+    if DEV_MODE:
+        _reload_if_changed()
+    return SCREENS[_lang(lang), survey_type.lower(), question_idx]
+
+
+def question_count(lang: str, survey_type: str) -> int:
+    if DEV_MODE:
+        _reload_if_changed()
+    return QUESTION_COUNTS[_lang(lang), survey_type.lower()]
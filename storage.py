@@ -0,0 +1,305 @@
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+)
+
+from database import pool, run_write
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+def _dumps(data: Dict[str, Any]) -> str:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram в таблице fsm_sessions (миграция 4).
+
+    Одна строка на активную сессию; каждое изменение — один UPSERT, поэтому
+    незавершённые опросы переживают перезапуск и видны всем процессам.
+    Сессия без изменений дольше ttl секунд считается истёкшей: она не
+    читается, а фоновая задача удаляет такие строки.
+    """
+
+    def __init__(self, key_builder: Optional[KeyBuilder] = None,
+                 ttl: float = 7200, sweep_interval: float = 60):
+        self.key_builder = key_builder or DefaultKeyBuilder(
+            with_bot_id=True, with_destiny=True
+        )
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper: asyncio.Task | None = None
+
+    def _deadline(self) -> float:
+        return time.time() - self.ttl
+
+    @timed
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        storage_key = self.key_builder.build(key)
+        self._ensure_sweeper()
+
+        async def op(db):
+            if state is None:
+                await db.execute(
+                    "UPDATE fsm_sessions SET state = NULL WHERE key = ?",
+                    (storage_key,)
+                )
+                await self._drop_empty(db, storage_key)
+                return
+            # Данные истёкшей сессии не переносятся в новую
+            await db.execute(
+                """INSERT INTO fsm_sessions (key, state, updated_at)
+                   VALUES (?, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET
+                       state = excluded.state,
+                       data = CASE WHEN updated_at < ? THEN '{}' ELSE data END,
+                       updated_at = excluded.updated_at""",
+                (storage_key, state, time.time(), self._deadline())
+            )
+
+        await run_write(op)
+
+    @timed
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with pool.read() as db:
+            cursor = await db.execute(
+                "SELECT state FROM fsm_sessions WHERE key = ? AND updated_at >= ?",
+                (self.key_builder.build(key), self._deadline())
+            )
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    @timed
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        self._ensure_sweeper()
+
+        async def op(db):
+            await db.execute(
+                """INSERT INTO fsm_sessions (key, data, updated_at)
+                   VALUES (?, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET
+                       data = excluded.data,
+                       state = CASE WHEN updated_at < ? THEN NULL ELSE state END,
+                       updated_at = excluded.updated_at""",
+                (storage_key, _dumps(data), time.time(), self._deadline())
+            )
+            if not data:
+                await self._drop_empty(db, storage_key)
+
+        await run_write(op)
+
+    @timed
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with pool.read() as db:
+            cursor = await db.execute(
+                "SELECT data FROM fsm_sessions WHERE key = ? AND updated_at >= ?",
+                (self.key_builder.build(key), self._deadline())
+            )
+            row = await cursor.fetchone()
+        return json.loads(row[0]) if row else {}
+
+    @staticmethod
+    async def _drop_empty(db, storage_key: str):
+        # Завершённая сессия (ни состояния, ни данных) не хранится
+        await db.execute(
+            "DELETE FROM fsm_sessions WHERE key = ? AND state IS NULL AND data = '{}'",
+            (storage_key,)
+        )
+
+    async def count_sessions(self) -> int:
+        # Пустые сессии удаляются (_drop_empty), истёкшие не считаются
+        async with pool.read() as db:
+            cursor = await db.execute(
+                "SELECT COUNT(*) FROM fsm_sessions WHERE updated_at >= ?",
+                (self._deadline(),)
+            )
+            return (await cursor.fetchone())[0]
+
+    async def sweep(self) -> int:
+        deadline = self._deadline()
+
+        async def op(db):
+            cursor = await db.execute(
+                "DELETE FROM fsm_sessions WHERE updated_at < ?", (deadline,)
+            )
+            return cursor.rowcount
+
+        return await run_write(op)
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception:
+                # Не удалось сейчас — удалим на следующем проходе
+                logger.exception("Failed to sweep expired FSM sessions")
+
+    async def close(self) -> None:
+        # Соединениями владеет database.pool, он закрывается в on_shutdown
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+
+class SessionRecord:
+    # Ответы опроса (0–3) хранятся байтами, а не списком int
+    __slots__ = ("state", "survey_type", "lang", "answers", "extra", "touched")
+
+    def __init__(self):
+        self.state = None
+        self.survey_type = None
+        self.lang = None
+        self.answers = None
+        self.extra = None
+        self.touched = 0.0
+
+    def pack(self, data: Dict[str, Any]):
+        answers = data.get("answers")
+        if (data.keys() <= {"type", "lang", "answers"}
+                and isinstance(answers, list)
+                and all(isinstance(a, int) and 0 <= a < 256 for a in answers)):
+            self.survey_type = data.get("type")
+            self.lang = data.get("lang")
+            self.answers = bytearray(answers)
+            self.extra = None
+        else:
+            # Произвольные FSM-данные храним как есть
+            self.survey_type = self.lang = self.answers = None
+            self.extra = dict(data) if data else None
+
+    def unpack(self) -> Dict[str, Any]:
+        if self.extra is not None:
+            return dict(self.extra)
+        if self.answers is None:
+            return {}
+        return {
+            "type": self.survey_type,
+            "lang": self.lang,
+            "answers": list(self.answers),
+        }
+
+    def is_empty(self) -> bool:
+        return self.state is None and self.answers is None and self.extra is None
+
+    def size(self) -> int:
+        total = sys.getsizeof(self)
+        if self.answers is not None:
+            total += sys.getsizeof(self.answers)
+        if self.extra is not None:
+            total += sys.getsizeof(self.extra)
+        return total
+
+
+class MemorySessionStorage(BaseStorage):
+    """FSM-хранилище в памяти процесса с ограничением размера.
+
+    Сессии, к которым не обращались дольше ttl секунд, удаляет фоновая
+    задача; при превышении max_sessions вытесняется самая давняя сессия.
+    Вытесненная сессия для обработчика выглядит как истёкшая.
+    """
+
+    def __init__(self, ttl: float = 7200, max_sessions: int = 50000,
+                 sweep_interval: float = 60):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self.evicted = 0
+        self.expired = 0
+        self._records: OrderedDict = OrderedDict()
+        self._sweeper: asyncio.Task | None = None
+
+    def _get(self, key: StorageKey) -> Optional[SessionRecord]:
+        record = self._records.get(key)
+        if record is None:
+            return None
+        if record.touched < time.monotonic() - self.ttl:
+            del self._records[key]
+            self.expired += 1
+            return None
+        return record
+
+    def _put(self, key: StorageKey, update):
+        self._ensure_sweeper()
+        record = self._get(key) or SessionRecord()
+        update(record)
+        if record.is_empty():
+            self._records.pop(key, None)
+            return
+        record.touched = time.monotonic()
+        self._records[key] = record
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_sessions:
+            self._records.popitem(last=False)
+            self.evicted += 1
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+
+        def update(record):
+            record.state = state
+
+        self._put(key, update)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._put(key, lambda record: record.pack(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get(key)
+        return record.unpack() if record else {}
+
+    def sweep(self) -> int:
+        # Записи упорядочены по последнему обращению — идём с начала
+        deadline = time.monotonic() - self.ttl
+        removed = 0
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if record.touched >= deadline:
+                break
+            del self._records[key]
+            removed += 1
+        self.expired += removed
+        return removed
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    async def count_sessions(self) -> int:
+        return len(self._records)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._records),
+            "bytes": sum(record.size() for record in self._records.values()),
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
@@ -0,0 +1,98 @@
+"""Стресс-проверка выдачи patient_code.
+
+Несколько процессов одновременно регистрируют тысячи пациентов в одной базе
+(часть telegram_id пересекается между процессами), после чего проверяется,
+что коды уникальны, идут без пропусков и каждый пациент получил ровно один код.
+
+Запуск: python stress_registration.py [--workers 4] [--users 2000]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+import database
+
+
+async def register_many(path: str, telegram_ids: list) -> dict:
+    pool = database.pool
+    pool.path = path
+    await database.init_db()
+    try:
+        codes = await asyncio.gather(
+            *(database.register_patient(tid, "ru") for tid in telegram_ids)
+        )
+    finally:
+        await pool.close()
+    return dict(zip(telegram_ids, codes))
+
+
+def worker(path: str, telegram_ids: list, results):
+    results.put(asyncio.run(register_many(path, telegram_ids)))
+
+
+def check(path: str, expected: int, issued: list):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT telegram_id, patient_code FROM patients").fetchall()
+    counter = conn.execute(
+        "SELECT total_patients FROM stats_counters WHERE id = 1"
+    ).fetchone()[0]
+    conn.close()
+
+    codes = sorted(int(code) for _, code in rows)
+    assert len(rows) == expected, f"{len(rows)} patients, expected {expected}"
+    assert codes == list(range(1, expected + 1)), "patient codes are not contiguous"
+    assert counter == expected, f"stats counter {counter}, expected {expected}"
+
+    # Повторная регистрация в другом процессе возвращает тот же код
+    stored = dict(rows)
+    for result in issued:
+        for telegram_id, code in result.items():
+            assert stored[telegram_id] == code, f"{telegram_id}: {code} != {stored[telegram_id]}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=2000, help="users per worker")
+    args = parser.parse_args()
+
+    # Соседние воркеры пересекаются на четверть диапазона telegram_id
+    step = args.users * 3 // 4
+    ranges = [
+        list(range(100000 + i * step, 100000 + i * step + args.users))
+        for i in range(args.workers)
+    ]
+    expected = len(set().union(*ranges))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stress.db")
+        asyncio.run(register_many(path, []))
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=worker, args=(path, ids, results))
+            for ids in ranges
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        issued = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        check(path, expected, issued)
+
+    total = sum(len(ids) for ids in ranges)
+    print(
+        f"OK: {total} registrations ({expected} unique) from {args.workers} "
+        f"processes in {elapsed:.2f}s ({total / elapsed:.0f}/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,23 @@
-from aiogram import Router, F, Bot
+from aiogram import Router, F
+from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery
 
 from database import (
-    get_patient, get_patient_language, save_survey_result,
-    save_alert, get_patient_results
+    get_patient, save_survey_result,
+    save_alert, get_patient_results_page, get_patient_trends
 )
-from keyboards import (
-    survey_answer_keyboard, back_to_menu_keyboard, main_menu_keyboard
-)
-from texts import get_text, TEXTS
+from keyboards import back_to_menu_keyboard, results_keyboard
+from screens import question_screen, question_count
+from texts import get_text
 from config import ADMIN_IDS
+from outbox import alert_outbox
 
 router = Router()
 
-# Хранилище текущих ответов (в памяти, для демо достаточно)
-user_surveys: dict = {}
+RESULTS_PAGE_SIZE = 10
+
+# Текущие ответы хранятся в FSM-данных пользователя: {"type", "lang", "answers"}.
+# Хранилище выбирается в bot.py (SESSION_STORAGE).
 
 
 def get_gad7_level(score: int) -> str:
@@ -43,67 +46,57 @@ def get_phq9_level(score: int) -> str:
 
 async def send_question(callback: CallbackQuery, survey_type: str,
                         question_idx: int, lang: str):
-    questions_key = f"{survey_type.lower()}_questions"
-    questions = get_text(lang, questions_key)
-    total = len(questions)
-
-    intro_key = f"{survey_type.lower()}_intro"
-    intro = get_text(lang, intro_key).format(current=question_idx + 1, total=total)
-
-    question_text = questions[question_idx]
+    text, keyboard = question_screen(lang, survey_type, question_idx)
 
     await callback.message.edit_text(
-        f"{intro}\n\n<b>{question_text}</b>",
-        reply_markup=survey_answer_keyboard(lang, survey_type.lower(), question_idx),
+        text,
+        reply_markup=keyboard,
         parse_mode="HTML"
     )
 
 
 @router.callback_query(F.data == "start_gad7")
-async def start_gad7(callback: CallbackQuery):
+async def start_gad7(callback: CallbackQuery, state: FSMContext):
     patient = await get_patient(callback.from_user.id)
     if not patient:
         await callback.answer("Нажмите /start", show_alert=True)
         return
 
     lang = patient["language"]
-    user_id = callback.from_user.id
-    user_surveys[user_id] = {"type": "GAD7", "answers": [], "lang": lang}
+    await state.set_data({"type": "GAD7", "answers": [], "lang": lang})
 
     await send_question(callback, "GAD7", 0, lang)
     await callback.answer()
 
 
 @router.callback_query(F.data == "start_phq9")
-async def start_phq9(callback: CallbackQuery):
+async def start_phq9(callback: CallbackQuery, state: FSMContext):
     patient = await get_patient(callback.from_user.id)
     if not patient:
         await callback.answer("Нажмите /start", show_alert=True)
         return
 
     lang = patient["language"]
-    user_id = callback.from_user.id
-    user_surveys[user_id] = {"type": "PHQ9", "answers": [], "lang": lang}
+    await state.set_data({"type": "PHQ9", "answers": [], "lang": lang})
 
     await send_question(callback, "PHQ9", 0, lang)
     await callback.answer()
 
 
 @router.callback_query(F.data.startswith("ans_"))
-async def handle_answer(callback: CallbackQuery, bot: Bot):
+async def handle_answer(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
 
-    if user_id not in user_surveys:
+    survey_data = await state.get_data()
+    if not survey_data:
         await callback.answer("Сессия истекла. Начните заново.", show_alert=True)
         return
 
     parts = callback.data.split("_")
     # ans_gad7_0_2 -> survey=gad7, q_idx=0, answer=2
-    survey_type_lower = parts[1]
     question_idx = int(parts[2])
     answer_value = int(parts[3])
 
-    survey_data = user_surveys[user_id]
     lang = survey_data["lang"]
     survey_type = survey_data["type"]
 
@@ -115,36 +108,31 @@ async def handle_answer(callback: CallbackQuery, bot: Bot):
 
     survey_data["answers"].append(answer_value)
 
-    questions_key = f"{survey_type_lower}_questions"
-    questions = get_text(lang, questions_key)
-    total = len(questions)
+    total = question_count(lang, survey_type)
 
     # PHQ-9, вопрос 9 (индекс 8) — проверка на суицидальные мысли
     if survey_type == "PHQ9" and question_idx == 8 and answer_value >= 2:
         patient = await get_patient(user_id)
         if patient:
+            # Оповещение админам уходит через outbox в фоне
             await save_alert(
                 user_id, patient["patient_code"],
-                "PHQ9_Q9_HIGH", answer_value
+                "PHQ9_Q9_HIGH", answer_value,
+                notify_ids=ADMIN_IDS,
+                notify_text=(
+                    f"🚨 <b>ВНИМАНИЕ!</b>\n\n"
+                    f"Пациент <code>{patient['patient_code']}</code>\n"
+                    f"PHQ-9, вопрос 9 (суицидальные мысли)\n"
+                    f"Ответ: <b>{answer_value}</b> из 3\n\n"
+                    f"Требуется внимание специалиста!"
+                )
             )
-            # Оповещение админам
-            for admin_id in ADMIN_IDS:
-                try:
-                    await bot.send_message(
-                        admin_id,
-                        f"🚨 <b>ВНИМАНИЕ!</b>\n\n"
-                        f"Пациент <code>{patient['patient_code']}</code>\n"
-                        f"PHQ-9, вопрос 9 (суицидальные мысли)\n"
-                        f"Ответ: <b>{answer_value}</b> из 3\n\n"
-                        f"Требуется внимание специалиста!",
-                        parse_mode="HTML"
-                    )
-                except Exception:
-                    pass
+            alert_outbox.notify()
 
     next_idx = question_idx + 1
 
     if next_idx < total:
+        await state.set_data(survey_data)
         await send_question(callback, survey_type, next_idx, lang)
     else:
         # Опрос завершён
@@ -159,11 +147,12 @@ async def handle_answer(callback: CallbackQuery, bot: Bot):
             level_text = get_text(lang, "phq9_levels")[level_key]
             recommendation = get_text(lang, "phq9_recommendations")[level_key]
 
-        # Сохраняем в БД
+        # Сохраняем в БД и закрываем сессию
         await save_survey_result(
             user_id, survey_type,
             survey_data["answers"], total_score, level_key
         )
+        await state.clear()
 
         # Формируем ответ
         result_text = get_text(lang, "survey_complete").format(
@@ -182,13 +171,11 @@ async def handle_answer(callback: CallbackQuery, bot: Bot):
             parse_mode="HTML"
         )
 
-        # Очищаем данные сессии
-        del user_surveys[user_id]
-
     await callback.answer()
 
 
 @router.callback_query(F.data == "my_results")
+@router.callback_query(F.data.startswith("my_results_"))
 async def my_results(callback: CallbackQuery):
     patient = await get_patient(callback.from_user.id)
     if not patient:
@@ -197,7 +184,15 @@ async def my_results(callback: CallbackQuery):
 
     lang = patient["language"]
     code = patient["patient_code"]
-    results = await get_patient_results(code)
+
+    # my_results_older_<id> / my_results_newer_<id>
+    parts = callback.data.split("_")
+    cursor = {}
+    if len(parts) == 4:
+        cursor = {"before_id" if parts[2] == "older" else "after_id": int(parts[3])}
+    results, has_older, has_newer = await get_patient_results_page(
+        code, RESULTS_PAGE_SIZE, **cursor
+    )
 
     if not results:
         await callback.message.edit_text(
@@ -210,7 +205,21 @@ async def my_results(callback: CallbackQuery):
 
     text = get_text(lang, "results_header")
 
-    for r in results[:10]:  # последние 10
+    # Изменение балла с прошлого раза — на первой странице
+    if not cursor:
+        trends = [t for t in await get_patient_trends(callback.from_user.id)
+                  if t["prev_score"] is not None]
+        for t in trends:
+            text += get_text(lang, "result_trend").format(
+                survey_type=t["survey_type"],
+                delta=f"{t['delta']:+d}",
+                prev_score=t["prev_score"],
+                last_score=t["last_score"]
+            )
+        if trends:
+            text += "\n"
+
+    for r in results:
         survey_type = r["survey_type"]
         date = r["completed_at"][:10]
         level_key = r["level"]
@@ -228,7 +237,11 @@ async def my_results(callback: CallbackQuery):
 
     await callback.message.edit_text(
         text,
-        reply_markup=back_to_menu_keyboard(lang),
+        reply_markup=results_keyboard(
+            lang,
+            newer_data=f"my_results_newer_{results[0]['id']}" if has_newer else None,
+            older_data=f"my_results_older_{results[-1]['id']}" if has_older else None,
+        ),
         parse_mode="HTML"
     )
     await callback.answer()
\ No newline at end of file
@@ -1,3 +1,7 @@
+import re
+from string import Formatter
+from types import MappingProxyType
+
 TEXTS = {
     "ru": {
         "choose_language": "🌐 Выберите язык / Тілді таңдаңыз:",
@@ -46,6 +50,8 @@ TEXTS = {
         "btn_change_lang": "🌐 Сменить язык",
         "btn_about": "ℹ️ О боте",
         "btn_menu": "🏠 Главное меню",
+        "btn_newer": "⬅️ Новее",
+        "btn_older": "Раньше ➡️",
 
         "about": (
             "ℹ️ <b>О проекте Qamqor</b>\n\n"
@@ -188,6 +194,11 @@ TEXTS = {
 
         "results_header": "📈 <b>Ваши результаты:</b>\n\n",
 
+        "result_trend": (
+            "🔄 {survey_type}: балл изменился на {delta} с прошлого раза "
+            "({prev_score} → {last_score})\n"
+        ),
+
         "result_item": (
             "📋 {survey_type} — {date}\n"
             "Уровень: {level}\n\n"
@@ -243,6 +254,8 @@ TEXTS = {
         "btn_change_lang": "🌐 Тілді ауыстыру",
         "btn_about": "ℹ️ Бот туралы",
         "btn_menu": "🏠 Басты мәзір",
+        "btn_newer": "⬅️ Жаңалары",
+        "btn_older": "Бұрынғылары ➡️",
 
         "about": (
             "ℹ️ <b>Qamqor жобасы туралы</b>\n\n"
@@ -377,6 +390,11 @@ TEXTS = {
 
         "results_header": "📈 <b>Сіздің нәтижелеріңіз:</b>\n\n",
 
+        "result_trend": (
+            "🔄 {survey_type}: өткен жолдан бері балл {delta} өзгерді "
+            "({prev_score} → {last_score})\n"
+        ),
+
         "result_item": (
             "📋 {survey_type} — {date}\n"
             "Деңгей: {level}\n\n"
@@ -387,5 +405,108 @@ TEXTS = {
 }
 
 
+DEFAULT_LANG = "ru"
+
+_HTML_TAG = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*?(/?)>")
+
+
+def _compile(texts: dict) -> dict:
+    # Плоская таблица на язык: недостающие ключи уже подставлены из русской
+    default = texts[DEFAULT_LANG]
+    return {
+        lang: MappingProxyType({**default, **table})
+        for lang, table in texts.items()
+    }
+
+
+CATALOG = _compile(TEXTS)
+_DEFAULT_TABLE = CATALOG[DEFAULT_LANG]
+
+
 def get_text(lang: str, key: str) -> str:
-    return TEXTS.get(lang, TEXTS["ru"]).get(key, TEXTS["ru"].get(key, ""))
\ No newline at end of file
+    return CATALOG.get(lang, _DEFAULT_TABLE).get(key, "")
+
+
+def _strings(value, path: str):
+    # Все строки значения: сама строка, элементы списка, значения словаря
+    if isinstance(value, str):
+        yield path, value
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from _strings(item, f"{path}[{i}]")
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            yield from _strings(item, f"{path}.{key}")
+
+
+def _shape(value):
+    # Структура значения без самих текстов: тип, длина списка, ключи словаря
+    if isinstance(value, list):
+        return ("list", len(value))
+    if isinstance(value, dict):
+        return ("dict", tuple(sorted(value)))
+    return (type(value).__name__,)
+
+
+def _placeholders(text: str) -> set:
+    return {name for _, name, _, _ in Formatter().parse(text) if name is not None}
+
+
+def _html_errors(text: str) -> list:
+    stack = []
+    for closing, tag, self_closing in _HTML_TAG.findall(text):
+        tag = tag.lower()
+        if self_closing:
+            continue
+        if not closing:
+            stack.append(tag)
+        elif not stack or stack.pop() != tag:
+            return [f"unexpected </{tag}>"]
+    return [f"unclosed <{tag}>" for tag in stack]
+
+
+def validate_texts(texts: dict) -> list:
+    errors = []
+    default = texts[DEFAULT_LANG]
+    for lang, table in texts.items():
+        for key in default.keys() - table.keys():
+            errors.append(f"{lang}: missing key {key!r}")
+        for key in table.keys() - default.keys():
+            errors.append(f"{lang}: extra key {key!r}")
+
+        for key, value in table.items():
+            strings = dict(_strings(value, key))
+            for path, text in strings.items():
+                try:
+                    _placeholders(text)
+                except ValueError as e:
+                    errors.append(f"{lang}.{path}: bad format string ({e})")
+                for problem in _html_errors(text):
+                    errors.append(f"{lang}.{path}: {problem}")
+
+            if key not in default or lang == DEFAULT_LANG:
+                continue
+            if _shape(value) != _shape(default[key]):
+                errors.append(
+                    f"{lang}.{key}: shape {_shape(value)} != {_shape(default[key])}"
+                )
+                continue
+            reference = dict(_strings(default[key], key))
+            for path, text in strings.items():
+                try:
+                    expected = _placeholders(reference.get(path, ""))
+                    found = _placeholders(text)
+                except ValueError:
+                    continue
+                if found != expected:
+                    errors.append(
+                        f"{lang}.{path}: placeholders {sorted(found)} != {sorted(expected)}"
+                    )
+    return errors
+
+
+def check_texts():
+    # Вызывается при запуске бота: лучше не стартовать, чем показать битый текст
+    errors = validate_texts(TEXTS)
+    if errors:
+        raise ValueError("Invalid texts.py:\n" + "\n".join(errors))
\ No newline at end of file
@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import TG_GLOBAL_RATE, TG_CHAT_RATE, TG_CHAT_BURST
+from tracing import record_span
+from metrics import send_wait_seconds
+
+# Приоритеты исходящих запросов: меньше — важнее
+INTERACTIVE = 0
+ALERT = 1
+BULK = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", ALERT: "alert", BULK: "bulk"}
+
+_priority: ContextVar[int] = ContextVar("send_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def send_priority(priority: int):
+    # Все запросы к Bot API внутри блока идут с заданным приоритетом
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        # Через сколько секунд будет доступен токен (0 — уже есть)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """Ограничитель исходящих запросов к Bot API (middleware сессии aiogram).
+
+    Общий token bucket на исходящие сообщения бота (send*) и по одному на
+    чат; ответы на callback и правки сообщений общий лимит не тратят,
+    answerCallbackQuery без чата не ограничивается вовсе. Когда токенов нет,
+    запросы ждут в очереди с приоритетом: ответы пользователю идут раньше
+    оповещений и массовых рассылок.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1,
+                 chat_burst: float = 3, max_idle_buckets: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_idle_buckets = max_idle_buckets
+        self._chats: dict = {}
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._pump: asyncio.Task | None = None
+        self._wakeup = asyncio.Event()
+        self.requests = 0
+        self.delayed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.retry_after = 0
+
+    def _chat_bucket(self, chat_id):
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_idle_buckets:
+                self._prune()
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune(self):
+        # Полные корзины ничего не ограничивают — их можно забыть
+        now = time.monotonic()
+        for chat_id, bucket in list(self._chats.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity and now >= bucket.blocked_until:
+                del self._chats[chat_id]
+
+    async def acquire(self, chat_id, priority: int = INTERACTIVE,
+                      limited: bool = True):
+        # limited — запрос расходует общий лимит бота
+        chat = self._chat_bucket(chat_id)
+        if chat is None and not limited:
+            send_wait_seconds.observe(0.0, PRIORITY_NAMES[priority])
+            return
+        now = time.monotonic()
+        if (not self._waiters
+                and (not limited or self.global_bucket.delay(now) == 0)
+                and (chat is None or chat.delay(now) == 0)):
+            if limited:
+                self.global_bucket.take()
+            if chat is not None:
+                chat.take()
+            send_wait_seconds.observe(0.0, PRIORITY_NAMES[priority])
+            return
+
+        started = now
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters, (priority, next(self._seq), chat_id, limited, future)
+        )
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        else:
+            self._wakeup.set()
+        await future
+
+        waited = time.monotonic() - started
+        send_wait_seconds.observe(waited, PRIORITY_NAMES[priority])
+        self.delayed += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    async def _run(self):
+        while self._waiters:
+            now = time.monotonic()
+            sleep_for = None
+            remaining = []
+            for waiter in sorted(self._waiters):
+                priority, _, chat_id, limited, future = waiter
+                if future.done():
+                    continue
+                global_delay = self.global_bucket.delay(now) if limited else 0.0
+                chat = self._chat_bucket(chat_id)
+                chat_delay = chat.delay(now) if chat is not None else 0.0
+                if global_delay == 0 and chat_delay == 0:
+                    if limited:
+                        self.global_bucket.take()
+                    if chat is not None:
+                        chat.take()
+                    future.set_result(None)
+                    continue
+                remaining.append(waiter)
+                delay = max(global_delay, chat_delay)
+                sleep_for = delay if sleep_for is None else min(sleep_for, delay)
+            heapq.heapify(remaining)
+            self._waiters = remaining
+            if not remaining:
+                break
+            # Новый запрос (возможно, в свободный чат) будит раньше срока
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        limited = method.__api_method__.startswith("send")
+        self.requests += 1
+        started = time.perf_counter()
+        await self.acquire(chat_id, _priority.get(), limited)
+        ended = time.perf_counter()
+        # В трассу update попадает только реальное ожидание лимита
+        if ended - started > 0.001:
+            record_span("queue", type(method).__name__, started, ended)
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            # Telegram сам сказал, сколько ждать — блокируем корзину
+            self.retry_after += 1
+            now = time.monotonic()
+            chat = self._chat_bucket(chat_id)
+            if chat is not None:
+                chat.block(now, e.retry_after)
+            elif limited:
+                self.global_bucket.block(now, e.retry_after)
+            raise
+
+    def stats(self) -> dict:
+        depth = {INTERACTIVE: 0, ALERT: 0, BULK: 0}
+        for priority, _, _, _, future in self._waiters:
+            if not future.done():
+                depth[priority] = depth.get(priority, 0) + 1
+        return {
+            "queue_depth": sum(depth.values()),
+            "queue_depth_interactive": depth[INTERACTIVE],
+            "queue_depth_alert": depth[ALERT],
+            "queue_depth_bulk": depth[BULK],
+            "requests": self.requests,
+            "delayed": self.delayed,
+            "wait_seconds_total": self.wait_total,
+            "wait_seconds_max": self.wait_max,
+            "retry_after": self.retry_after,
+        }
+
+
+send_scheduler = SendScheduler(TG_GLOBAL_RATE, TG_CHAT_RATE, TG_CHAT_BURST)
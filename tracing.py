@@ -0,0 +1,162 @@
+# Трассировка обработки update: внешний middleware открывает трассу на каждый
+# update, а вложенные замеры (обработчик, database.py и SQLiteStorage, ожидание в
+# send_scheduler, запросы к Bot API) добавляются в неё через record_span.
+# Текущая трасса хранится в ContextVar, поэтому замеры из фоновых задач
+# (outbox, write_batcher) в неё не попадают.
+#
+# Медленные update (дольше TRACE_SLOW_MS) пишутся в лог с разбивкой. Если задан
+# TRACE_FILE, доля TRACE_SAMPLE update и все медленные дописываются туда в
+# формате Chrome Trace Event — файл открывается в chrome://tracing или Perfetto.
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+
+from aiogram import BaseMiddleware
+
+from config import TRACE_SLOW_MS, TRACE_FILE, TRACE_SAMPLE
+
+logger = logging.getLogger(__name__)
+
+# Категории вложенных замеров в порядке вывода
+CATEGORIES = ("handler", "db", "queue", "telegram")
+
+
+class Trace:
+    __slots__ = ("update_id", "event_type", "started", "wall", "spans")
+
+    def __init__(self, update_id: int, event_type: str):
+        self.update_id = update_id
+        self.event_type = event_type
+        self.started = time.perf_counter()
+        self.wall = time.time()
+        # (категория, имя, начало, конец, ошибка, вложенность) по perf_counter
+        self.spans = []
+
+
+_current: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+
+def record_span(category: str, name: str, started: float, ended: float,
+                error: str | None = None, depth: int = 0):
+    # Вне update (фоновые задачи) трассы нет — замер не сохраняется.
+    # depth > 0 — замер внутри другого замера той же категории
+    trace = _current.get()
+    if trace is not None:
+        trace.spans.append((category, name, started, ended, error, depth))
+
+
+def format_breakdown(trace: Trace, total: float) -> str:
+    # В итогах только внешние замеры, иначе вложенные считаются дважды
+    totals = {category: [0, 0.0] for category in CATEGORIES}
+    for category, _, started, ended, _, depth in trace.spans:
+        if depth:
+            continue
+        totals.setdefault(category, [0, 0.0])
+        totals[category][0] += 1
+        totals[category][1] += ended - started
+
+    handler = next(
+        (name for category, name, *_ in trace.spans if category == "handler"), "-"
+    )
+    summary = ", ".join(
+        f"{category} {seconds * 1000:.1f} ms ({count})"
+        for category, (count, seconds) in totals.items() if count
+    )
+    lines = [
+        f"Slow update {trace.update_id} ({trace.event_type}, {handler}): "
+        f"{total * 1000:.1f} ms; {summary or 'no spans'}"
+    ]
+    # Замеры добавляются по завершении — для вывода сортируем по началу
+    for category, name, started, ended, error, depth in sorted(
+            trace.spans, key=lambda s: s[2]):
+        name = "  " * depth + name
+        line = (
+            f"  +{(started - trace.started) * 1000:8.1f} ms  {category:<8} "
+            f"{name:<34} {(ended - started) * 1000:8.1f} ms"
+        )
+        if error:
+            line += f"  {error}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class TraceFile:
+    """Дописывает события в JSON-массив формата Chrome Trace Event.
+
+    Закрывающая скобка не пишется — просмотрщики её не требуют, поэтому
+    файл можно дописывать между перезапусками.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._pid = os.getpid()
+
+    def _event(self, trace: Trace, category: str, name: str,
+               started: float, ended: float, args: dict) -> str:
+        return json.dumps({
+            "name": name, "cat": category, "ph": "X",
+            "ts": round(trace.wall * 1e6 + (started - trace.started) * 1e6),
+            "dur": round((ended - started) * 1e6),
+            # Отдельная дорожка на каждый update
+            "pid": self._pid, "tid": trace.update_id,
+            "args": args,
+        }, ensure_ascii=False)
+
+    def write(self, trace: Trace, ended: float):
+        if self._file is None:
+            new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            # Буферизованная запись: на цикл событий ложится только копирование в буфер
+            self._file = open(self.path, "a", encoding="utf-8")
+            if new:
+                self._file.write("[\n")
+        events = [self._event(
+            trace, "update", trace.event_type, trace.started, ended,
+            {"update_id": trace.update_id}
+        )]
+        # Вложенность просмотрщик восстанавливает сам по времени
+        for category, name, started, span_ended, error, _ in trace.spans:
+            events.append(self._event(
+                trace, category, name, started, span_ended,
+                {"error": error} if error else {}
+            ))
+        self._file.write(",\n".join(events) + ",\n")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class UpdateTracing(BaseMiddleware):
+    # Внешний middleware на dp.update, регистрируется первым
+    def __init__(self, slow_ms: float = TRACE_SLOW_MS, path: str = TRACE_FILE,
+                 sample: float = TRACE_SAMPLE):
+        self.slow = slow_ms / 1000
+        self.sample = sample
+        self.trace_file = TraceFile(path) if path else None
+
+    async def __call__(self, handler, event, data):
+        trace = Trace(event.update_id, event.event_type)
+        token = _current.set(trace)
+        try:
+            return await handler(event, data)
+        finally:
+            _current.reset(token)
+            ended = time.perf_counter()
+            total = ended - trace.started
+            slow = self.slow > 0 and total >= self.slow
+            if slow:
+                logger.warning(format_breakdown(trace, total))
+            if self.trace_file and (slow or random.random() < self.sample):
+                self.trace_file.write(trace, ended)
+
+    def close(self):
+        if self.trace_file:
+            self.trace_file.close()
+
+
+update_tracing = UpdateTracing()
\ No newline at end of file